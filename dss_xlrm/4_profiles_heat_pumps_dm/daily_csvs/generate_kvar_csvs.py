@@ -17,6 +17,9 @@ START_PROCESS = time.time()
 # Folder where the kW CSVs are
 base_csv_folder = "./"
 
+# Also write float32 .sng twins of the kvar CSVs (and of kW CSVs that lack one)
+WRITE_SNG = True
+
 # Load the pickle of ratios (from Script 2b)
 with open("kvar_ratios.pkl", "rb") as f:
     kvar_ratios = pickle.load(f)
@@ -80,6 +83,12 @@ for folder_name in folder_list:
 
         pd.DataFrame(kvar_values).to_csv(kvar_path, index=False, header=False)
 
+        if WRITE_SNG:
+            kvar_values.astype("<f4").tofile(kvar_path.replace(".csv", ".sng"))
+            kw_sng_path = kw_csv_path.replace(".csv", ".sng")
+            if not os.path.exists(kw_sng_path):
+                kw_values.astype("<f4").tofile(kw_sng_path)
+
 print("✅ Finished generating kvar CSVs!")
 
 END_PROCESS = time.time()
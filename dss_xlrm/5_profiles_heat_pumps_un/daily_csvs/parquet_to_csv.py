@@ -28,6 +28,9 @@ START_PROCESS = time.time()
 
 base_parquet_dir = "../daily_parquets"
 
+# Also write each profile as a float32 .sng file (read by OpenDSS without text parsing)
+WRITE_SNG = True
+
 folder_timestamps = {}
 folder_equiv = {}
 folder_list_loadshapes = {}
@@ -306,6 +309,10 @@ for folder_name in folder_list:
         # np.savetxt(kw_csv_path, arr_kw, delimiter="\n")
         np.savetxt(kw_csv_path, arr_kw, delimiter="\n", fmt="%.4f")
 
+        # Binary twin of the CSV (float32, same rounding) → OpenDSS mult=(sngfile=...)
+        if WRITE_SNG:
+            np.round(arr_kw, 4).astype("<f4").tofile(os.path.join(out_folder, f"{final_name}.sng"))
+
         # print('check how you got up until here')
         # sys.exit()
 
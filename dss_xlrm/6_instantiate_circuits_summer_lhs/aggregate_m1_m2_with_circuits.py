@@ -8,6 +8,10 @@ Created on Tue Nov 11 20:35:25 2025
 #!/usr/bin/env python3
 # Aggregate m1/m2 CSVs and add (a) timestep column and (b) one time-independent
 # summary row per circuit with counts from .dss and substation transformer kVA.
+# Folders run with RESULTS_FORMAT=npz carry ModifiedCircuitData/results.npz instead of
+# monitor CSVs; their m1/m2 tables are rebuilt from the arrays (no CSV re-parse).
+# The .dss files are read through the shared cached feeder model (pfs_feeder_model), and
+# the substation transformer comes from the cached feeder topology (pfs_topology).
 # Procedural / minimal functions approach.
 
 import re
@@ -16,12 +20,22 @@ from pathlib import Path
 import pandas as pd
 import numpy as np
 
+sys.path.insert(0, str(Path(__file__).resolve().parent / "deployer_modules"))
+from pfs_feeder_model import load_dss_model
+from pfs_topology import load_topology
+
 # ---------- small helpers kept inline ----------
-def _dephase(bus_name: str) -> str:
-    # Remove phase suffixes like ".1.2.3" and parentheses, quotes
-    b = bus_name.strip().strip('"').strip("'")
-    b = re.split(r"[.\(]", b, maxsplit=1)[0]
-    return b.lower()
+def _monitor_frame(res, name: str) -> pd.DataFrame:
+    # Rebuild a mode=1 monitor table (hour, t(sec), S/Ang per phase) from results.npz arrays
+    P = res[f"{name}_P"]; Q = res[f"{name}_Q"]
+    hour = res["hour"]
+    cols = {"hour": np.floor(hour + 1e-9).astype(int), " t(sec)": np.round((hour - np.floor(hour + 1e-9)) * 3600.0, 3)}
+    for i in range(P.shape[1]):
+        if np.all(np.isnan(P[:, i])):
+            continue  # phase not present at this terminal
+        cols[f" S{i+1} (kVA)"] = np.hypot(P[:, i], Q[:, i])
+        cols[f" Ang{i+1}"] = np.degrees(np.arctan2(Q[:, i], P[:, i]))
+    return pd.DataFrame(cols)
 
 # Folder pattern: e.g. uhs18_1247_circuit_54_1  -> (uhs18) (circuit_54) (1)
 FOLDER_RE = re.compile(r"^(uhs\d+)_\d+_(circuit_\d+)_(\d+)$", re.IGNORECASE)
@@ -65,169 +79,76 @@ if __name__ == "__main__":
             problems.append(f"{circuit_dir.name}  # Missing ModifiedCircuitData")
             continue
 
-        # ---- Validate and locate required m1/m2 CSVs (> 1 KiB) ----
-        csvs = [p for p in mcd.iterdir() if p.is_file() and p.suffix.lower() == ".csv"]
-        if not csvs:
-            problems.append(f"{circuit_dir.name}  # No CSV files found in ModifiedCircuitData")
-            continue
-
-        m1_candidates = [p for p in csvs if M1_RE.search(p.name)]
-        m2_candidates = [p for p in csvs if M2_RE.search(p.name)]
-
-        if not m1_candidates:
-            problems.append(f"{circuit_dir.name}  # No m1 CSV found")
-            continue
-        if not m2_candidates:
-            problems.append(f"{circuit_dir.name}  # No m2 CSV found")
-            continue
-
-        m1_big = [p for p in m1_candidates if p.stat().st_size > SIZE_THRESHOLD_BYTES]
-        m2_big = [p for p in m2_candidates if p.stat().st_size > SIZE_THRESHOLD_BYTES]
-
-        if not m1_big:
-            sizes = ", ".join(f"{p.name}={p.stat().st_size}B" for p in m1_candidates)
-            problems.append(f"{circuit_dir.name}  # m1 CSV(s) present but none > {SIZE_THRESHOLD_BYTES} bytes ({sizes})")
-            continue
-        if not m2_big:
-            sizes = ", ".join(f"{p.name}={p.stat().st_size}B" for p in m2_candidates)
-            problems.append(f"{circuit_dir.name}  # m2 CSV(s) present but none > {SIZE_THRESHOLD_BYTES} bytes ({sizes})")
-            continue
-
-        # Choose the largest qualifying m1/m2 file if multiple qualify
-        m1_path = max(m1_big, key=lambda p: p.stat().st_size)
-        m2_path = max(m2_big, key=lambda p: p.stat().st_size)
+        # ---- Runner results (results.npz) take precedence over monitor CSVs ----
+        npz_path = mcd / "results.npz"
+        use_npz = npz_path.is_file()
+        if use_npz:
+            try:
+                res = np.load(npz_path)
+                if "m1_P" not in res.files or "m2_P" not in res.files:
+                    problems.append(f"{circuit_dir.name}  # results.npz has no m1/m2 arrays")
+                    continue
+            except Exception as e:
+                problems.append(f"{circuit_dir.name}  # results.npz read error: {e}")
+                continue
+
+        if not use_npz:
+            # ---- Validate and locate required m1/m2 CSVs (> 1 KiB) ----
+            csvs = [p for p in mcd.iterdir() if p.is_file() and p.suffix.lower() == ".csv"]
+            if not csvs:
+                problems.append(f"{circuit_dir.name}  # No CSV files found in ModifiedCircuitData")
+                continue
+
+            m1_candidates = [p for p in csvs if M1_RE.search(p.name)]
+            m2_candidates = [p for p in csvs if M2_RE.search(p.name)]
+
+            if not m1_candidates:
+                problems.append(f"{circuit_dir.name}  # No m1 CSV found")
+                continue
+            if not m2_candidates:
+                problems.append(f"{circuit_dir.name}  # No m2 CSV found")
+                continue
+
+            m1_big = [p for p in m1_candidates if p.stat().st_size > SIZE_THRESHOLD_BYTES]
+            m2_big = [p for p in m2_candidates if p.stat().st_size > SIZE_THRESHOLD_BYTES]
+
+            if not m1_big:
+                sizes = ", ".join(f"{p.name}={p.stat().st_size}B" for p in m1_candidates)
+                problems.append(f"{circuit_dir.name}  # m1 CSV(s) present but none > {SIZE_THRESHOLD_BYTES} bytes ({sizes})")
+                continue
+            if not m2_big:
+                sizes = ", ".join(f"{p.name}={p.stat().st_size}B" for p in m2_candidates)
+                problems.append(f"{circuit_dir.name}  # m2 CSV(s) present but none > {SIZE_THRESHOLD_BYTES} bytes ({sizes})")
+                continue
+
+            # Choose the largest qualifying m1/m2 file if multiple qualify
+            m1_path = max(m1_big, key=lambda p: p.stat().st_size)
+            m2_path = max(m2_big, key=lambda p: p.stat().st_size)
 
         # ---- Parse DSS files for counts + substation transformer kVA ----
-        dss_files = list(mcd.rglob("*.dss"))
+        # one tokenizer pass per file, cached by content (files shared across mixes parse once)
+        dss_files = sorted(mcd.rglob("*.dss"))
+        model = load_dss_model(dss_files)
 
-        load_names = set()
-        storage_names = set()
-        pv_names = set()
-        ev_names = set()
+        def _has_ev_hint(nm, props):
+            return any(h in nm for h in EV_HINTS) or any(
+                h in str(v).lower() for v in props.values() for h in EV_HINTS)
 
-        source_buses = set()
-        line_edges = set()  # undirected edges via Lines (store both directions)
-        transformers = []   # list of dicts: {'buses': set([...]), 'kva': float or None}
-
-        for dss in dss_files:
-            try:
-                text = dss.read_text(encoding="utf-8", errors="ignore")
-            except Exception:
-                text = dss.read_text(errors="ignore")
-
-            for raw in text.splitlines():
-                # strip comments (// or !) and whitespace
-                core = re.split(r"//|!", raw)[0].strip()
-                if not core:
-                    continue
-                line = core.lower()
-
-                # Count loads / storage / PV / EVs (heuristic for EV names)
-                mload = re.search(r"\bnew\s+load\.([^\s=]+)", line)
-                if mload:
-                    nm = mload.group(1)
-                    load_names.add(nm)
-                    if any(h in nm for h in EV_HINTS) or any(h in line for h in EV_HINTS):
-                        ev_names.add(nm)
-
-                msto = re.search(r"\bnew\s+storage\.([^\s=]+)", line)
-                if msto:
-                    nm = msto.group(1)
-                    storage_names.add(nm)
-                    if any(h in nm for h in EV_HINTS) or any(h in line for h in EV_HINTS):
-                        ev_names.add(nm)
-
-                mpv = re.search(r"\bnew\s+pvsystem\.([^\s=]+)", line)
-                if mpv:
-                    pv_names.add(mpv.group(1))
-
-                # Vsource: grab substation/source bus
-                if "new vsource." in line:
-                    mb1 = re.search(r"\bbus1\s*=\s*([^\s\[\],]+)", line)
-                    if mb1:
-                        source_buses.add(_dephase(mb1.group(1)))
-
-                # Lines: build graph neighbors of source bus
-                if "new line." in line:
-                    b1 = re.search(r"\bbus1\s*=\s*([^\s\[\],]+)", line)
-                    b2 = re.search(r"\bbus2\s*=\s*([^\s\[\],]+)", line)
-                    if b1 and b2:
-                        bb1 = _dephase(b1.group(1))
-                        bb2 = _dephase(b2.group(1))
-                        line_edges.add((bb1, bb2))
-                        line_edges.add((bb2, bb1))
-
-                # Transformer: collect buses + kVA
-                if "new transformer." in line:
-                    t_buses = set()
-                    mbuses = re.search(r"\bbuses\s*=\s*\[([^\]]+)\]", line)
-                    if mbuses:
-                        inside = mbuses.group(1)
-                        for tok in re.split(r"[,\s]+", inside.strip()):
-                            if tok:
-                                t_buses.add(_dephase(tok))
-                    else:
-                        # Try bus / bus1 / bus2 tokens
-                        for key in ("bus1", "bus2", "bus"):
-                            # NOTE: rf-string is correct; avoid 'rfr"' typo.
-                            mkey = re.search(rf"\b{key}\s*=\s*([^\s\[\],]+)", line)
-                            if mkey:
-                                t_buses.add(_dephase(mkey.group(1)))
-
-                    kva_val = None
-                    mkva = re.search(r"\bkva\s*=\s*([\d\.eE\+\-]+)", line)
-                    if mkva:
-                        try:
-                            kva_val = float(mkva.group(1))
-                        except Exception:
-                            pass
-                    if kva_val is None:
-                        mkvas = re.search(r"\bkvas\s*=\s*\[([^\]]+)\]", line)
-                        if mkvas:
-                            nums = [s for s in re.split(r"[,\s]+", mkvas.group(1).strip()) if s]
-                            if nums:
-                                try:
-                                    kva_val = float(nums[0])
-                                except Exception:
-                                    pass
-
-                    transformers.append({"buses": t_buses, "kva": kva_val})
+        load_names = {nm.lower() for nm in model.get("load", {})}
+        storage_names = {nm.lower() for nm in model.get("storage", {})}
+        pv_names = {nm.lower() for nm in model.get("pvsystem", {})}
+        ev_names = {nm.lower() for cls in ("load", "storage")
+                    for nm, props in model.get(cls, {}).items() if _has_ev_hint(nm.lower(), props)}
 
         n_loads = len(load_names)
         n_storage = len(storage_names)
         n_pv = len(pv_names)
         n_evs = len(ev_names)
 
-        # Heuristic: pick transformer connected to Vsource bus or one-hop neighbor via Lines
-        xfmr_kva = None
-        if source_buses:
-            src = next(iter(source_buses))
-            neighbors = {src}
-            for a, b in line_edges:
-                if a == src:
-                    neighbors.add(b)
-
-            # Prefer transformer that directly touches the source bus
-            chosen = None
-            for t in transformers:
-                if src in t["buses"]:
-                    chosen = t
-                    break
-            if chosen is None:
-                for t in transformers:
-                    if t["buses"] & neighbors:
-                        chosen = t
-                        break
-            if chosen is None and transformers:
-                # Fallback: largest kVA transformer if nothing matched
-                cand = [t["kva"] for t in transformers if t["kva"] is not None]
-                if cand:
-                    xfmr_kva = max(cand)
-            else:
-                xfmr_kva = chosen["kva"] if chosen else None
-        elif transformers:
-            cand = [t["kva"] for t in transformers if t["kva"] is not None]
-            xfmr_kva = max(cand) if cand else None
+        # Substation transformer kVA from the feeder topology (built once per feeder, cached):
+        # transformer on the Vsource bus or one Line hop away, else the largest rating
+        topo = load_topology(dss_files)
+        xfmr_kva = topo.head_transformer_kva()
 
         # Record a clean, time-independent summary row for this circuit
         summary_rows.append({
@@ -244,8 +165,12 @@ if __name__ == "__main__":
 
         # ---- Load and annotate m1/m2 CSVs, add timestep + summary row ----
         try:
-            df_m1 = pd.read_csv(m1_path)
-            df_m2 = pd.read_csv(m2_path)
+            if use_npz:
+                df_m1 = _monitor_frame(res, "m1")
+                df_m2 = _monitor_frame(res, "m2")
+            else:
+                df_m1 = pd.read_csv(m1_path)
+                df_m2 = pd.read_csv(m2_path)
 
             # Add identifiers
             for df in (df_m1, df_m2):
@@ -13,6 +13,7 @@ import sys
 import re
 import csv
 from pathlib import Path
+import numpy as np
 
 # --- Config (change if you need different behavior) ---
 # Regex for folders like: uhs0_1247_circuit_1_0
@@ -47,6 +48,20 @@ if __name__ == "__main__":
         if not mcd.is_dir():
             status = "FAIL"
             reasons.append("Missing ModifiedCircuitData/")
+        elif (mcd / "results.npz").is_file():
+            # Runner wrote results.npz (RESULTS_FORMAT=npz): m1/m2 live there, not in CSVs
+            try:
+                with np.load(mcd / "results.npz") as res:
+                    for mon in ("m1", "m2"):
+                        if f"{mon}_P" not in res.files:
+                            status = "FAIL"
+                            reasons.append(f"No {mon} arrays in results.npz.")
+                        elif res[f"{mon}_P"].shape[0] == 0:
+                            status = "FAIL"
+                            reasons.append(f"{mon} arrays in results.npz are empty.")
+            except Exception as e:
+                status = "FAIL"
+                reasons.append(f"results.npz unreadable: {e}")
         else:
             # Only look at CSV files directly under ModifiedCircuitData (not recursive)
             csv_files = [p for p in mcd.iterdir() if p.is_file() and p.suffix.lower() == ".csv"]
@@ -110,6 +125,6 @@ if __name__ == "__main__":
             print(f"  - {n}")
         sys.exit(1)
     else:
-        print("PASS: all matching circuit folders have m1 and m2 CSVs > 1 KiB.")
+        print("PASS: all matching circuit folders have m1 and m2 results (CSVs > 1 KiB or results.npz).")
         print(f"Report: {report_path}")
         sys.exit(0)
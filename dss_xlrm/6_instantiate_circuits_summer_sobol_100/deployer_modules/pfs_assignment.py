@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+Module Name: pfs_assignment.py
+Description:
+    Multi-mix assignment engine for the instantiate script. For one feeder it takes the
+    whole mixes JSON and computes, for every mix at once:
+        - heating labels (baseline / dm / un) of every load base, with exact counts from
+          largest-remainder rounding of the shares (min-one for positive shares);
+        - EV hosts (split into uncontrolled / controlled), storage and PV 3-phase hosts,
+          with the same count, min-one and disjointness rules as before.
+    Random orders are drawn as one (mixes × items) matrix of keys, one row per mix seed,
+    and ranked with a single argsort, so 100 mixes cost little more than one. Each row's
+    generator is seeded from a BLAKE2 digest of the mix seed and the feeder (heating) or
+    circuit folder (hosts) name, so assignments are identical in every process and run
+    (unlike the built-in str hash, which Python randomises per process). The result
+    is a compact table of arrays; `mix_assignment` renders one mix back to names for the
+    file writers (LoadShapes.dss, Loads.dss, scenario_assignments.json, audit rows).
+    `mix_streams` gives the deploy runner independent generators (EV sessions, heat
+    pumps, DSS file edits) spawned from a SeedSequence of the mix seed.
+
+Functions:
+    - mix_parameters: Per-mix parameter arrays from the mixes JSON (defaults, clamping,
+      normalised shares and EV split).
+    - heating_counts: Exact per-mix label counts (largest remainder + min-one).
+    - derive_seed: Stable generator seed from a mix seed and names.
+    - assign_mixes: Assignment table of every mix for one feeder.
+    - mix_assignment: One mix of the table, as names.
+    - mix_streams: Independent generators of one mix (SeedSequence spawn).
+
+Usage:
+    This module is intended to be imported and used by
+    `instantiate_circuits_and_runs_APPLYFILTER.py` (and `power_flow_sim_daily_EV_STO_DG_deploy.py`
+    for `mix_streams`). It is not designed to be executed directly.
+
+Author: Luis F. Victor Gallardo
+Date: 2026/10/18
+Version: 0.3
+"""
+
+import hashlib
+
+import numpy as np
+
+HEATING_LABELS = ("baseline", "dm", "un")
+MIX_STREAMS = ("ev", "hp", "dss")   # spawn order; append new streams at the end
+
+# min-one donors per label, in the order they are tried (ties → first)
+_MIN_ONE_DONORS = ((0, (1, 2)), (1, (0, 2)), (2, (1, 0)))
+
+
+def mix_parameters(mixes, lvl2_default=0.80, disjoint_default=True, split_ctl_default=0.5):
+    """
+    Per-mix parameters of a mixes JSON, with defaults filled in.
+
+    Parameters:
+    - mixes (dict): {mix name: mix config} as in mixes_lhs.json / mixes_sobol.json.
+    - lvl2_default (float): ev_lvl2_perc when a mix omits it.
+    - disjoint_default (bool): disjoint_sets when a mix omits it.
+    - split_ctl_default (float): Controlled EV share when a mix omits ev_split.
+
+    Returns:
+    - dict: 'names' (list) and one array per parameter: 'shares' (M, 3, normalised, all
+      baseline when they sum to 0), 'heating_seed', 'ev_perc', 'ev_lvl2', 'ev_seed',
+      'storage_perc', 'storage_seed', 'pv_perc', 'pv_seed' (percentages clamped to
+      [0, 1]), 'disjoint', 'split_ctl', 'split_un'.
+    """
+    names = list(mixes)
+    cols = {k: [] for k in ("shares", "heating_seed", "ev_perc", "ev_lvl2", "ev_seed", "storage_perc",
+                            "storage_seed", "pv_perc", "pv_seed", "disjoint", "split_ctl", "split_un")}
+    for name in names:
+        cfg = mixes[name]
+        shares = cfg['shares']
+        heating_seed = int(cfg.get('heating_seed', 123))
+        cols["shares"].append([float(shares.get(k, 0.0)) for k in HEATING_LABELS])
+        cols["heating_seed"].append(heating_seed)
+        cols["ev_perc"].append(float(cfg.get('ev_perc', 0.0)))
+        cols["ev_lvl2"].append(float(cfg.get('ev_lvl2_perc', lvl2_default)))
+        cols["ev_seed"].append(int(cfg.get('ev_seed', heating_seed)))
+        cols["storage_perc"].append(float(cfg.get('storage_perc_3ph', 0.0)))
+        cols["storage_seed"].append(int(cfg.get('storage_seed', heating_seed)))
+        cols["pv_perc"].append(float(cfg.get('pv_perc_3ph', 0.0)))
+        cols["pv_seed"].append(int(cfg.get('pv_seed', heating_seed)))
+        cols["disjoint"].append(bool(cfg.get('disjoint_sets', disjoint_default)))
+        split = cfg.get('ev_split', {})
+        split_ctl = float(split.get('controlled', split_ctl_default))
+        cols["split_ctl"].append(split_ctl)
+        cols["split_un"].append(float(split.get('uncontrolled', 1.0 - split_ctl)))
+
+    p = {k: np.array(v) for k, v in cols.items()}
+    p["shares"] = p["shares"].reshape(len(names), len(HEATING_LABELS))
+    tot = p["shares"].sum(axis=1, keepdims=True)
+    p["shares"] = np.where(tot > 0, p["shares"] / np.where(tot > 0, tot, 1.0), [1.0, 0.0, 0.0])
+    for k in ("ev_perc", "storage_perc", "pv_perc"):
+        p[k] = np.clip(p[k].astype(float), 0.0, 1.0)
+
+    # EV split: negative shares → 0, normalised (50/50 when both are 0)
+    ctl, un = np.maximum(p["split_ctl"], 0.0), np.maximum(p["split_un"], 0.0)
+    norm = ctl + un
+    p["split_ctl"] = np.where(norm > 0, ctl / np.where(norm > 0, norm, 1.0), 0.5)
+    p["split_un"] = 1.0 - p["split_ctl"]
+    p["names"] = names
+    return p
+
+
+def heating_counts(shares, n):
+    """
+    Exact heating label counts of every mix.
+
+    Parameters:
+    - shares (np.ndarray): (M, 3) normalised baseline/dm/un shares.
+    - n (int): Number of load bases.
+
+    Returns:
+    - np.ndarray: (M, 3) int counts summing to n per row. Largest-remainder rounding
+      (ties go to un, then dm, then baseline); a label with a positive share and no base
+      takes one from the largest other label that has more than one.
+    """
+    shares = np.asarray(shares, dtype=float)
+    m = shares.shape[0]
+    rows = np.arange(m)
+    raw = shares * n
+    cnt = np.floor(raw).astype(np.int64)
+    need = np.maximum(n - cnt.sum(axis=1), 0)
+    order = np.lexsort((np.broadcast_to(-np.arange(3), (m, 3)), -(raw - cnt)), axis=1)
+    cnt += (need // 3)[:, None]
+    for j in range(3):
+        cnt[rows, order[:, j]] += (need % 3 > j)
+
+    for label, (d0, d1) in _MIN_ONE_DONORS:
+        c0 = np.where(cnt[:, d0] > 1, cnt[:, d0], -1)
+        c1 = np.where(cnt[:, d1] > 1, cnt[:, d1], -1)
+        donor = np.where(c0 >= c1, d0, d1)
+        fix = (shares[:, label] > 0) & (cnt[:, label] == 0) & (np.maximum(c0, c1) > 0)
+        cnt[rows[fix], donor[fix]] -= 1
+        cnt[fix, label] += 1
+    return cnt
+
+
+def derive_seed(seed, *names):
+    """
+    Stable generator seed from a mix seed and names (BLAKE2b, the same in every process).
+
+    Parameters:
+    - seed (int): Mix seed (heating_seed, ev_seed, ...).
+    - *names (str): Names the draw depends on (e.g. substation and feeder, or circuit folder).
+
+    Returns:
+    - int: 64-bit seed.
+    """
+    h = hashlib.blake2b(str(int(seed)).encode("utf-8"), digest_size=8)
+    for name in names:
+        h.update(b"\x1f" + str(name).encode("utf-8"))
+    return int.from_bytes(h.digest(), "little")
+
+
+def _keys(seeds, n):
+    """(M, n) uniform keys, one generator per row seed; argsort of a row is a random order."""
+    return np.array([np.random.default_rng(int(s)).random(n) for s in seeds]).reshape(len(seeds), n)
+
+
+def _first_k(keys, k):
+    """Row-wise indices of the k smallest finite keys (the first k of each random order)."""
+    order = np.argsort(keys, axis=1, kind="stable")
+    k = np.minimum(k, np.isfinite(keys).sum(axis=1))
+    return [order[i, :k[i]] for i in range(keys.shape[0])]
+
+
+def _host_count(perc, eligible):
+    n = np.rint(perc * eligible).astype(np.int64)
+    return np.where((perc > 0) & (eligible > 0), np.clip(n, 1, max(eligible, 1)), n)
+
+
+def assign_mixes(params, bases, three_phase_base, heating_names, host_names):
+    """
+    Assignment table of every mix for one feeder.
+
+    Parameters:
+    - params (dict): Output of `mix_parameters`.
+    - bases (list): Load bases (EV and heating candidates), sorted.
+    - three_phase_base (list): 3-phase load bases (storage/PV candidates), sorted.
+    - heating_names (tuple): Names mixed into each heating seed (substation, feeder).
+    - host_names (list): (M,) per-mix names (circuit folders) mixed into the EV/storage/PV
+      seeds.
+
+    Returns:
+    - dict: 'params', 'bases', 'three_phase_base', 'heating' ((M, N) int8 label index per
+      base), 'heating_counts' ((M, 3)), 'n_ev', 'n_ev_un', 'n_ev_ctl', 'n_sto', 'n_pv',
+      'ev_bumped' (M,) arrays, 'ev_hosts', 'sto_hosts', 'pv_hosts' (per-mix index
+      arrays into bases / three_phase_base, in pick order) and 'rng_seeds' (derived
+      'heating', 'ev', 'storage', 'pv' seeds, lists of M ints).
+    """
+    n, n3 = len(bases), len(three_phase_base)
+    m = len(params["names"])
+    rng_seeds = {
+        "heating": [derive_seed(s, *heating_names) for s in params["heating_seed"].tolist()],
+        "ev": [derive_seed(s, nm) for s, nm in zip(params["ev_seed"].tolist(), host_names)],
+        "storage": [derive_seed(s, nm) for s, nm in zip(params["storage_seed"].tolist(), host_names)],
+        "pv": [derive_seed(s, nm) for s, nm in zip(params["pv_seed"].tolist(), host_names)],
+    }
+
+    # Heating: exact counts, labels by rank in a random order of the bases
+    cnt = heating_counts(params["shares"], n)
+    rank = np.argsort(np.argsort(_keys(rng_seeds["heating"], n), axis=1, kind="stable"),
+                      axis=1, kind="stable")
+    heating = ((rank >= cnt[:, [0]]).astype(np.int8) + (rank >= cnt[:, [0]] + cnt[:, [1]]))
+
+    # Counts: rounding, min-one when the percentage is positive, ≥2 EVs to get both types
+    n_ev = _host_count(params["ev_perc"], n)
+    n_sto = _host_count(params["storage_perc"], n3)
+    n_pv = _host_count(params["pv_perc"], n3)
+    ev_bumped = (n_ev == 1) & (params["ev_perc"] > 0) & (n >= 2)
+    n_ev = np.where(ev_bumped, 2, n_ev)
+    n_ev_ctl = np.rint(n_ev * params["split_ctl"]).astype(np.int64)
+    n_ev_un = n_ev - n_ev_ctl
+    both = n_ev >= 2
+    fix = both & (n_ev_ctl == 0)
+    n_ev_ctl, n_ev_un = np.where(fix, 1, n_ev_ctl), np.where(fix, n_ev - 1, n_ev_un)
+    fix = both & (n_ev_un == 0)
+    n_ev_un, n_ev_ctl = np.where(fix, 1, n_ev_un), np.where(fix, n_ev - 1, n_ev_ctl)
+
+    # Hosts: first k of a random order per mix (PV skips storage hosts when disjoint,
+    # unless storage took every 3-phase base)
+    ev_hosts = _first_k(_keys(rng_seeds["ev"], n), n_ev)
+    sto_hosts = _first_k(_keys(rng_seeds["storage"], n3), n_sto)
+    pv_keys = _keys(rng_seeds["pv"], n3)
+    for i in range(m):
+        if params["disjoint"][i] and not (n_pv[i] > 0 and sto_hosts[i].size == n3 and n3 > 0):
+            pv_keys[i, sto_hosts[i]] = np.inf
+    pv_hosts = _first_k(pv_keys, n_pv)
+
+    return {
+        "params": params, "bases": list(bases), "three_phase_base": list(three_phase_base),
+        "heating": heating, "heating_counts": cnt,
+        "n_ev": n_ev, "n_ev_un": n_ev_un, "n_ev_ctl": n_ev_ctl, "n_sto": n_sto, "n_pv": n_pv,
+        "ev_bumped": ev_bumped, "ev_hosts": ev_hosts, "sto_hosts": sto_hosts, "pv_hosts": pv_hosts,
+        "rng_seeds": rng_seeds,
+    }
+
+
+def mix_assignment(table, i):
+    """
+    One mix of an assignment table, as names.
+
+    Parameters:
+    - table (dict): Output of `assign_mixes`.
+    - i (int): Mix row.
+
+    Returns:
+    - dict: 'name', 'base_to_scen' {base: label}, 'counts' (n_baseline, n_dm, n_un),
+      'ev_loads_uncontrolled', 'ev_loads_controlled', 'ev_hosts', 'storage_bases',
+      'pv_bases' (lists of bases), 'ev_bumped', and the mix parameters as Python scalars
+      ('shares', 'ev_perc', 'ev_lvl2', 'ev_seed', 'storage_perc', 'storage_seed',
+      'pv_perc', 'pv_seed', 'disjoint', 'split_ctl', 'split_un'), plus 'rng_seeds'
+      {'heating', 'ev', 'storage', 'pv': derived seed}.
+    """
+    p = table["params"]
+    bases, tpb = table["bases"], table["three_phase_base"]
+    ev = [bases[j] for j in table["ev_hosts"][i]]
+    n_un = int(table["n_ev_un"][i])
+    out = {
+        "name": p["names"][i],
+        "base_to_scen": {b: HEATING_LABELS[k] for b, k in zip(bases, table["heating"][i].tolist())},
+        "counts": tuple(int(c) for c in table["heating_counts"][i]),
+        "ev_hosts": ev,
+        "ev_loads_uncontrolled": ev[:n_un],
+        "ev_loads_controlled": ev[n_un:],
+        "storage_bases": [tpb[j] for j in table["sto_hosts"][i]],
+        "pv_bases": [tpb[j] for j in table["pv_hosts"][i]],
+        "ev_bumped": bool(table["ev_bumped"][i]),
+        "shares": tuple(float(s) for s in p["shares"][i]),
+    }
+    for k in ("ev_perc", "ev_lvl2", "storage_perc", "pv_perc", "split_ctl", "split_un"):
+        out[k] = float(p[k][i])
+    for k in ("ev_seed", "storage_seed", "pv_seed"):
+        out[k] = int(p[k][i])
+    out["disjoint"] = bool(p["disjoint"][i])
+    out["rng_seeds"] = {k: v[i] for k, v in table["rng_seeds"].items()}
+    return out
+
+
+def mix_streams(seed, names=MIX_STREAMS):
+    """
+    Independent random generators of one mix, spawned from a SeedSequence of the mix seed.
+
+    Each consumer draws from its own stream instead of the global NumPy state, so the
+    results do not depend on call order and several mixes can run in one process or
+    in parallel with the same numbers as sequential runs.
+
+    Parameters:
+    - seed (int): Mix seed (e.g. ev_seed from scenario_assignments.json).
+    - names (tuple, optional): Stream names, in spawn order (the i-th child always
+      belongs to the i-th name, so only append).
+
+    Returns:
+    - dict: {name: np.random.Generator}.
+    """
+    children = np.random.SeedSequence(int(seed)).spawn(len(names))
+    return {name: np.random.default_rng(child) for name, child in zip(names, children)}
@@ -18,12 +18,11 @@ Usage:
 
 Author: Luis F. Victor Gallardo
 Date: 2024/03/21
-Version: 0.1
+Version: 0.2
 """
 
 
 # Import general packages
-import comtypes.client as cc
 import os 
 import datetime
 import pandas as pd
@@ -40,12 +39,46 @@ from datetime import datetime, timedelta
 import random
 import math
 import cmath
+from bisect import bisect_left
+
+
+# Line-name patterns excluded from transformer classification, and low-voltage markers
+LINE_EXCLUSION_PATTERNS = ["padswitch", "con", "disswitch", "_disconnect", "_cont"]
+LV_LINE_MARKERS = ["lv)", "lv-"]
+
+
+def _bus_prefix_index(lines, names):
+    """
+    Sorted (bus, line position) pairs of the given lines, for prefix lookups by bisection.
+
+    Parameters:
+    - lines (dict): Line data with 'bus1' and 'bus2'.
+    - names (list): Line names to index, in output order.
+
+    Returns:
+    - tuple: (sorted bus names, matching line positions in `names`).
+    """
+    pairs = sorted((bus, pos) for pos, nm in enumerate(names)
+                   for bus in {lines[nm]['bus1'], lines[nm]['bus2']})
+    return [b for b, _ in pairs], [p for _, p in pairs]
+
+
+def _lines_with_bus_prefix(index, prefix):
+    """Positions of the indexed lines with bus1 or bus2 starting with `prefix`."""
+    buses, positions = index
+    lo = bisect_left(buses, prefix)
+    hi = bisect_left(buses, prefix + "\U0010ffff")
+    return set(positions[lo:hi])
 
 
 def parse_transformers(file_content, lines):
     """
     Parses transformer data from a given file content.
 
+    Lines are classified once (excluded / low voltage / mid voltage) and indexed by bus,
+    so each transformer only looks up the lines whose buses start with its own buses
+    instead of scanning every line.
+
     Parameters:
     - file_content (str): The content of the file containing transformer definitions.
     - lines (dict): A dictionary containing line data, used to categorize lines connected to transformers.
@@ -53,6 +86,19 @@ def parse_transformers(file_content, lines):
     Returns:
     - dict: A dictionary where keys are transformer names and values are dictionaries containing details about phases, kVA rating, buses, and connected mid and low voltage lines.
     """
+    # Enhanced Rule 1: exclude lines based on specific patterns (case-insensitive);
+    # Rule 2: low-voltage lines carry "lv)" or "lv-"; Rule 3: the rest are mid-voltage
+    lv_names, mv_names = [], []
+    for line_name in lines:
+        line_name_lower = line_name.lower()
+        if any(substring in line_name_lower for substring in LINE_EXCLUSION_PATTERNS):
+            continue
+        if any(marker in line_name_lower for marker in LV_LINE_MARKERS):
+            lv_names.append(line_name)
+        else:
+            mv_names.append(line_name)
+    lv_index = mv_index = None
+
     transformers = {}
     for line in file_content.splitlines():
         if line.startswith("New Transformer."):
@@ -75,25 +121,20 @@ def parse_transformers(file_content, lines):
             # Categorize lines based on their connection to mid or low voltage buses
             mid_voltage_bus = buses[0]  # First bus is assumed to be mid voltage
             low_voltage_buses = buses[1:]  # Remaining buses are low voltage
-
-            for line_name, line_data in lines.items():
-                # Lowercase line name for case-insensitive comparison
-                line_name_lower = line_name.lower()
-            
-                # Enhanced Rule 1: Exclude lines based on specific patterns
-                exclusion_patterns = ["padswitch", "con", "disswitch", "_disconnect", "_cont"]
-                if any(substring in line_name_lower for substring in exclusion_patterns):
-                    continue
-            
-                # Rule 2: Identify low-voltage lines specifically with "lv)" or "lv-"
-                if "lv)" in line_name_lower or "lv-" in line_name_lower:
-                    for lv_bus in low_voltage_buses:
-                        if line_data['bus1'].startswith(lv_bus) or line_data['bus2'].startswith(lv_bus):
-                            transformers[name]['low_voltage_lines'].append(line_name)
-                else:
-                    # Rule 3: Classify remaining lines as mid-voltage
-                    if line_data['bus1'].startswith(mid_voltage_bus) or line_data['bus2'].startswith(mid_voltage_bus):
-                        transformers[name]['mid_voltage_lines'].append(line_name)
+            if lv_index is None:
+                lv_index = _bus_prefix_index(lines, lv_names)
+                mv_index = _bus_prefix_index(lines, mv_names)
+
+            # A low-voltage line is listed once per low-voltage bus it touches (in line order)
+            lv_hits = {}
+            for lv_bus in low_voltage_buses:
+                for pos in _lines_with_bus_prefix(lv_index, lv_bus):
+                    lv_hits[pos] = lv_hits.get(pos, 0) + 1
+            for pos in sorted(lv_hits):
+                transformers[name]['low_voltage_lines'].extend([lv_names[pos]] * lv_hits[pos])
+
+            for pos in sorted(_lines_with_bus_prefix(mv_index, mid_voltage_bus)):
+                transformers[name]['mid_voltage_lines'].append(mv_names[pos])
 
     return transformers
 
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Regression test of pfs_parsing_misc.parse_transformers (bus-indexed) against a frozen
+copy of the former transformers × lines scan, on generated feeders.
+
+Run from the stage-6 folder:  python -m pytest deployer_modules/tests -q
+"""
+
+import os
+import re
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pfs_parsing_misc import parse_transformers, parse_lines  # noqa: E402
+
+
+def parse_transformers_reference(file_content, lines):
+    """Former implementation (frozen copy, do not edit)."""
+    transformers = {}
+    for line in file_content.splitlines():
+        if line.startswith("New Transformer."):
+            parts = line.split()
+            name = parts[1]
+            phases = re.search(r'phases=(\d)', line).group(1)
+            kva_rating = float(re.search(r'kva=(\d+\.?\d*)', line).group(1))
+            buses = re.findall(r'bus=([^\s.]+)', line)
+            transformers[name] = {
+                'phases': phases,
+                'kva_rating': kva_rating,
+                'buses': buses,
+                'mid_voltage_lines': [],
+                'low_voltage_lines': []
+            }
+            mid_voltage_bus = buses[0]
+            low_voltage_buses = buses[1:]
+            for line_name, line_data in lines.items():
+                line_name_lower = line_name.lower()
+                exclusion_patterns = ["padswitch", "con", "disswitch", "_disconnect", "_cont"]
+                if any(substring in line_name_lower for substring in exclusion_patterns):
+                    continue
+                if "lv)" in line_name_lower or "lv-" in line_name_lower:
+                    for lv_bus in low_voltage_buses:
+                        if line_data['bus1'].startswith(lv_bus) or line_data['bus2'].startswith(lv_bus):
+                            transformers[name]['low_voltage_lines'].append(line_name)
+                else:
+                    if line_data['bus1'].startswith(mid_voltage_bus) or line_data['bus2'].startswith(mid_voltage_bus):
+                        transformers[name]['mid_voltage_lines'].append(line_name)
+    return transformers
+
+
+# bus stems with overlapping prefixes (p1udt1 / p1udt10 / p1udt100, ...)
+_STEMS = ["p1udt1", "p1udt10", "p1udt100", "p1udt2", "p1udt21", "p1ulv1", "p1ulv10", "p2udm5", "p2udm50"]
+_LINE_TAGS = ["l(r:{a}-{b})", "l(r:{a}lv)", "l(r:{a}lv-{b})", "padswitch_{a}", "con_{a}", "disswitch({a})",
+              "l_{a}_disconnect", "l_{a}_cont", "L(R:{A}LV)", "Line_{a}"]
+
+
+def generated_feeder(seed, n_lines=120, n_xfmrs=25):
+    """Lines.dss and Transformers.dss text of a random feeder."""
+    rng = random.Random(seed)
+    buses = _STEMS + [f"{rng.choice(_STEMS)}{rng.randint(0, 30)}" for _ in range(20)]
+    line_txt = []
+    for k in range(n_lines):
+        a, b = rng.choice(buses), rng.choice(buses)
+        name = rng.choice(_LINE_TAGS).format(a=a, b=b, A=a.upper()) + f"_{k}"
+        line_txt.append(f"New Line.{name} phases=1 bus1={a}.1 bus2={b}.1.2 length=0.1 units=km")
+    xfmr_txt = []
+    for k in range(n_xfmrs):
+        wdg = [rng.choice(buses) for _ in range(rng.randint(2, 3))]
+        if rng.random() < 0.3:
+            wdg[-1] = wdg[-2]          # repeated winding bus
+        body = " ".join(f"wdg={i + 1} bus={b}.1.0 kv=0.24" for i, b in enumerate(wdg))
+        xfmr_txt.append(f"New Transformer.t{k} phases={rng.choice((1, 3))} windings={len(wdg)} "
+                        f"{body} kva={rng.choice((25, 50.0, 112.5))}")
+    return "\n".join(line_txt), "\n".join(xfmr_txt)
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_matches_reference_on_generated_feeders(seed):
+    line_txt, xfmr_txt = generated_feeder(seed)
+    lines = parse_lines(line_txt)
+    assert parse_transformers(xfmr_txt, lines) == parse_transformers_reference(xfmr_txt, lines)
+
+
+def test_overlapping_prefixes_repeated_buses_and_exclusions():
+    line_txt = "\n".join([
+        "New Line.l(r:p1udt1-p1udt10) bus1=p1udt1.1 bus2=p1udt10.1",
+        "New Line.l(r:p1udt10lv) bus1=p1udt10.1 bus2=p1udt100.1",
+        "New Line.l(r:p1udt1lv-x) bus1=p1udt1.1 bus2=x.1",
+        "New Line.padswitch(p1udt1) bus1=p1udt1.1 bus2=p1udt10.1",
+        "New Line.l(r:p1udt1)_cont bus1=p1udt1.1 bus2=p1udt10.1",
+        "New Line.l(r:p1udt2lv) bus1=p1udt2.1 bus2=p1udt21.1",
+    ])
+    xfmr_txt = "\n".join([
+        "New Transformer.ta phases=1 windings=3 wdg=1 bus=p1udt1.1.0 wdg=2 bus=p1udt10.1.0 wdg=3 bus=p1udt10.0.2 kva=25",
+        "New Transformer.tb phases=3 windings=2 wdg=1 bus=p1udt2.1.2.3 wdg=2 bus=p1udt2.1.2.3 kva=112.5",
+    ])
+    lines = parse_lines(line_txt)
+    new = parse_transformers(xfmr_txt, lines)
+    assert new == parse_transformers_reference(xfmr_txt, lines)
+    # a low-voltage line is listed once per low-voltage bus it touches
+    assert new["Transformer.ta"]["low_voltage_lines"].count("Line.l(r:p1udt10lv)") == 2
+    assert all("padswitch" not in n and "_cont" not in n
+               for t in new.values() for n in t["mid_voltage_lines"] + t["low_voltage_lines"])
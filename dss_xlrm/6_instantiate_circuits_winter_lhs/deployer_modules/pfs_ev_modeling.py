@@ -18,7 +18,6 @@ Version: 0.1
 """
 
 # Import general packages
-import comtypes.client as cc
 import os 
 import datetime
 import pandas as pd
@@ -35,79 +34,102 @@ from datetime import datetime, timedelta
 import random
 import math
 import cmath
+import hashlib
+
+from pfs_feeder_model import CACHE_DIR
+
+EV_SEED = 555   # seed of the default generator (when no rng is passed)
+
+
+def _generator(rng):
+    """`rng`, or a fresh default generator seeded with EV_SEED."""
+    return np.random.default_rng(EV_SEED) if rng is None else rng
+
 
 # Function to generate initial random charging sessions
-def generate_initial_charging_sessions(N, total_intervals, nominal_power, min_power, max_charging_events, average_demand):
-    np.random.seed(555)
-    sessions = np.zeros((N, total_intervals))
-    demand_per_ev = average_demand / N  # Divide the average demand evenly across all EVs
-    for i in range(N):
-        # Ensure at least one charging event per EV
-        start_interval = np.random.randint(0, total_intervals - 1)
-        end_interval = np.random.randint(start_interval + 1, total_intervals)
-        power_assigned = np.random.uniform(min_power, nominal_power)
-        sessions[i, start_interval:end_interval] = power_assigned
-        remaining_power = power_assigned - (end_interval - start_interval) * power_assigned
-
-        # Additional charging events if needed
-        for _ in range(1, max_charging_events):
-            potential_starts = np.where(remaining_power > min_power)[0]
-            if potential_starts.size > 0:
-                start_interval = np.random.choice(potential_starts)
-                end_interval = np.random.randint(start_interval + 1, min(start_interval + 4, total_intervals))
-                power_assigned = np.random.uniform(min_power, min(nominal_power, remaining_power[start_interval]))
-                sessions[i, start_interval:end_interval] = power_assigned
-                remaining_power[start_interval:end_interval] -= power_assigned
-                if end_interval < total_intervals:
-                    sessions[i, start_interval:end_interval] = np.maximum.accumulate(sessions[i, start_interval:end_interval])
-            else:
-                break  # No more power needed in the remaining intervals
-    return sessions
+def generate_initial_charging_sessions(N, total_intervals, nominal_power, min_power, max_charging_events, average_demand, rng=None):
+    """
+    Draws one random charging session per EV, for all N EVs at once.
+
+    Each EV charges at a constant power, uniform in [min_power, nominal_power], from a start
+    interval uniform in [0, total_intervals - 2] up to an end interval uniform in
+    [start + 1, total_intervals - 1] (exclusive). Starts, ends and powers are drawn as
+    arrays and scattered into the session matrix with one broadcast comparison.
+
+    The former per-EV loop could also add up to max_charging_events - 1 short events while
+    the remaining power of the first session exceeded min_power; that remaining power is
+    power * (1 - duration) <= 0, so the extra events never happened (and recent NumPy
+    rejects the 0-d np.where it relied on). The calibration passes
+    (adjust_charging_sessions, adjust_charging_sessions_2) shape the result towards
+    average_demand and bound the events per EV.
+
+    Parameters:
+    - N (int): Number of EVs.
+    - total_intervals (int): Intervals of the day (96 at 15 min).
+    - nominal_power (float): Charger power (kW).
+    - min_power (float): Lowest session power (kW).
+    - max_charging_events (int): Events per EV allowed by the calibration passes.
+    - average_demand (np.ndarray): Target mean load per interval (used by the calibration passes).
+    - rng (np.random.Generator, optional): Stream to draw from (default: seeded with EV_SEED).
+
+    Returns:
+    - np.ndarray: (N, total_intervals) charging power per EV and interval.
+    """
+    rng = _generator(rng)
+    start_interval = rng.integers(0, total_intervals - 1, size=N)
+    end_interval = rng.integers(start_interval + 1, total_intervals)
+    power_assigned = rng.uniform(min_power, nominal_power, size=N)
+    intervals = np.arange(total_intervals)
+    charging = (intervals >= start_interval[:, None]) & (intervals < end_interval[:, None])
+    return np.where(charging, power_assigned[:, None], 0.0)
+
+
+def _calibrate_interval(column, lower_bound, upper_bound, nominal_power):
+    """
+    Brings one interval's mean load into [lower_bound, upper_bound], in place.
+
+    Above the upper bound, charging EVs are zeroed in index order until the mean is back
+    under it; below the lower bound, EVs under nominal power are raised to it in index order
+    until the mean reaches it. How many EVs to touch comes from the cumulative sum of the
+    candidates' changes against the column sum (closed form, O(N)) instead of recomputing
+    the mean after every single EV.
+
+    Parameters:
+    - column (np.ndarray): (N,) view of one interval of the sessions matrix.
+    - lower_bound (float): Lowest acceptable mean load.
+    - upper_bound (float): Highest acceptable mean load.
+    - nominal_power (float): Power EVs are raised to.
+    """
+    N = column.size
+    current_load = np.mean(column)
+    if current_load > upper_bound:
+        candidates = np.flatnonzero(column > 0)
+        load_after = (current_load * N - np.cumsum(column[candidates])) / N
+        enough = load_after <= upper_bound
+    elif current_load < lower_bound:
+        candidates = np.flatnonzero(column < nominal_power)
+        load_after = (current_load * N + np.cumsum(nominal_power - column[candidates])) / N
+        enough = load_after >= lower_bound
+    else:
+        return
+    k = int(np.argmax(enough)) + 1 if enough.any() else candidates.size
+    column[candidates[:k]] = 0 if current_load > upper_bound else nominal_power
 
 
 def adjust_charging_sessions(sessions, average_demand, N, nominal_power, total_intervals, error_tolerance):
-    np.random.seed(555)
     # Target ranges from 90% to 100% of average_demand
     lower_bound = 0.9 * average_demand
     upper_bound = average_demand
 
+    # Zero out sessions above the upper bound / raise sessions below the lower bound,
+    # one interval at a time (running column sums, see _calibrate_interval)
     for interval in range(total_intervals):
-        # Calculate the average load for the current interval
-        current_load = np.mean(sessions[:, interval])
-
-        # If the load is above the upper bound, zero out some charging sessions
-        if current_load > upper_bound[interval]:
-            # Find sessions to zero out
-            overcharging_evs = np.where(sessions[:, interval] > 0)[0]
-            for ev in overcharging_evs:
-                # Zero out the session for this interval
-                sessions[ev, interval] = 0
-                current_load = np.mean(sessions[:, interval])
-                if current_load <= upper_bound[interval]:
-                    break
-
-        # If the load is below the lower bound, increase power for some sessions
-        elif current_load < lower_bound[interval]:
-            # Find sessions to increase
-            undercharging_evs = np.where(sessions[:, interval] < nominal_power)[0]
-            for ev in undercharging_evs:
-                # Increase the session to nominal power for this interval
-                sessions[ev, interval] = nominal_power
-                current_load = np.mean(sessions[:, interval])
-                if current_load >= lower_bound[interval]:
-                    break
-
-        # After adjustments, check if we are within the error tolerance
-        if not (lower_bound[interval] <= current_load <= upper_bound[interval] + error_tolerance):
-            # If not, we need a more refined adjustment, which may include redistributing power from other intervals
-            # Implement refined adjustment logic here...
-            pass
+        _calibrate_interval(sessions[:, interval], lower_bound[interval], upper_bound[interval], nominal_power)
 
     return sessions
 
 
 def balance_demand_with_zero_sessions(sessions, average_demand, N, nominal_power, total_intervals, min_power):
-    np.random.seed(555)
     zero_event_sessions = np.where(np.all(sessions == 0, axis=1))[0]
 
     for ev in zero_event_sessions:
@@ -128,49 +150,65 @@ def balance_demand_with_zero_sessions(sessions, average_demand, N, nominal_power
     return sessions
 
 
-def adjust_charging_sessions_2(sessions, average_demand, N, nominal_power, total_intervals, error_tolerance, max_charging_events, min_power):
-    np.random.seed(555)
-    
+def adjust_charging_sessions_2(sessions, average_demand, N, nominal_power, total_intervals, error_tolerance, max_charging_events, min_power, rng=None):
     lower_bound = 0.9 * average_demand
     upper_bound = average_demand
 
     # First Pass: Adjust sessions for average demand
     for interval in range(total_intervals):
-        current_load = np.mean(sessions[:, interval])
+        _calibrate_interval(sessions[:, interval], lower_bound[interval], upper_bound[interval], nominal_power)
 
-        if current_load > upper_bound[interval]:
-            overcharging_evs = np.where(sessions[:, interval] > 0)[0]
-            for ev in overcharging_evs:
-                sessions[ev, interval] = 0
-                current_load = np.mean(sessions[:, interval])
-                if current_load <= upper_bound[interval]:
-                    break
+    # Second Pass: Eliminate zero-event sessions (bounded, see repair_zero_sessions)
+    repair_zero_sessions(sessions, upper_bound, nominal_power, min_power, max_charging_events + 1, rng)
 
-        elif current_load < lower_bound[interval]:
-            undercharging_evs = np.where(sessions[:, interval] < nominal_power)[0]
-            for ev in undercharging_evs:
-                sessions[ev, interval] = nominal_power
-                current_load = np.mean(sessions[:, interval])
-                if current_load >= lower_bound[interval]:
-                    break
+    return sessions
 
-    # Second Pass: Eliminate zero-event sessions
-    for i in range(N):
-        if np.all(sessions[i, :] == 0):
-            # Introduce charging events while trying to maintain average demand
-            added_events = 0
-            while added_events < max_charging_events + 1 and np.all(sessions[i, :] == 0):
-                interval = np.random.randint(total_intervals)
-                if sessions[i, interval] == 0:
-                    sessions[i, interval] = np.random.uniform(min_power, nominal_power)
-                    added_events += 1
-
-                # Check if the adjustment is still within the average demand bounds
-                current_load = np.mean(sessions[:, interval])
-                if current_load > upper_bound[interval]:
-                    sessions[i, interval] = 0  # Revert if it exceeds the upper bound
 
-    return sessions
+def repair_zero_sessions(sessions, upper_bound, nominal_power, min_power, max_rounds, rng=None):
+    """
+    Gives EVs without any charging one event each, without pushing an interval's mean load
+    over upper_bound.
+
+    Every round draws, for all EVs still at zero, an interval among those with headroom
+    (upper_bound * N minus the column sum, at least min_power) and a power uniform in
+    [min_power, nominal_power]. Within each interval, draws are accepted in EV order while
+    they fit the headroom (grouped cumulative sum); the rest retry next round. At most
+    max_rounds rounds run, so the cost is bounded whatever the bounds.
+
+    Parameters:
+    - sessions (np.ndarray): (N, T) charging power per EV and interval (changed in place).
+    - upper_bound (np.ndarray): (T,) highest acceptable mean load per interval.
+    - nominal_power (float): Highest event power (kW).
+    - min_power (float): Lowest event power (kW).
+    - max_rounds (int): Rounds of draws.
+    - rng (np.random.Generator, optional): Stream to draw from (default: seeded with EV_SEED).
+
+    Returns:
+    - np.ndarray: Indices of the EVs still without charging (no interval had room).
+    """
+    rng = _generator(rng)
+    N = sessions.shape[0]
+    pending = np.flatnonzero(~sessions.any(axis=1))
+    headroom = upper_bound * N - sessions.sum(axis=0)
+    for _ in range(max_rounds):
+        open_intervals = np.flatnonzero(headroom >= min_power)
+        if pending.size == 0 or open_intervals.size == 0:
+            break
+        interval = open_intervals[rng.integers(open_intervals.size, size=pending.size)]
+        power = rng.uniform(min_power, nominal_power, size=pending.size)
+
+        # accept in EV order within each interval while the cumulative power fits
+        order = np.argsort(interval, kind="stable")
+        interval, power, rows = interval[order], power[order], pending[order]
+        csum = np.cumsum(power)
+        first = np.r_[0, np.flatnonzero(np.diff(interval)) + 1]
+        before = np.repeat(csum[first] - power[first], np.diff(np.r_[first, interval.size]))
+        fits = csum - before <= headroom[interval]
+
+        sessions[rows[fits], interval[fits]] = power[fits]
+        headroom -= np.bincount(interval[fits], weights=power[fits], minlength=headroom.size)
+        pending = np.sort(rows[~fits])
+    return pending
 
 
 def count_charging_cycles(sessions):
@@ -189,3 +227,112 @@ def count_charging_cycles(sessions):
 
     return cycles_count
 
+
+
+# ---------- Session library (calibrated sessions cached on disk) ----------
+EV_SESSIONS_VERSION = 4   # bump when the runner's post-processing of the sessions changes
+EV_SESSIONS_MEM_MAX = 4   # session sets kept in memory (oldest dropped first)
+_EV_SESSIONS_MEM = {}
+
+
+def ev_sessions_key(average_demand, N, nominal_power, max_charging_events, error_tolerance, seed=EV_SEED):
+    """
+    Cache key of a calibrated session set (e.g. a session library, see ev_library_size).
+
+    The generation is seeded, so the sessions depend only on the demand profile, the
+    number of sessions, the charger/calibration parameters and the seed of the stream; the
+    source of this module is hashed too, so editing the calibration invalidates the sets.
+
+    Parameters:
+    - average_demand (array-like): Average EV demand per interval (kW).
+    - N (int): Number of sessions (EVs) in the set.
+    - nominal_power (float): Charger power (kW).
+    - max_charging_events (int): Events per EV allowed by the calibration.
+    - error_tolerance (float): Calibration tolerance.
+    - seed (int, optional): Seed the session stream is derived from.
+
+    Returns:
+    - str: Hex digest (with the EV_SESSIONS_VERSION suffix).
+    """
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(average_demand, dtype=np.float64).tobytes())
+    h.update(repr((int(N), float(nominal_power), int(max_charging_events), float(error_tolerance),
+                   int(seed))).encode())
+    with open(os.path.abspath(__file__), "rb") as f:
+        h.update(f.read())
+    return h.hexdigest() + f"_e{EV_SESSIONS_VERSION}"
+
+
+def load_ev_sessions(key, build, cache_dir=CACHE_DIR):
+    """
+    Session arrays for `key`, from memory, from `ev_sessions_<key>.npz` in the cache
+    folder, or from `build()` (then stored, written atomically).
+
+    Parameters:
+    - key (str): Output of `ev_sessions_key`.
+    - build (callable): Returns {name: np.ndarray} when the key is not cached.
+    - cache_dir (str, optional): Folder for the .npz files (None: memory only).
+
+    Returns:
+    - dict: {name: np.ndarray} (copies; the cached arrays are not shared).
+    """
+    arrays = _EV_SESSIONS_MEM.get(key)
+    npz = os.path.join(cache_dir, f"ev_sessions_{key}.npz") if cache_dir else None
+    if arrays is None and npz and os.path.exists(npz):
+        try:
+            with np.load(npz, allow_pickle=False) as z:
+                arrays = {k: z[k] for k in z.files}
+        except Exception:
+            arrays = None
+    if arrays is None:
+        arrays = {k: np.asarray(v) for k, v in build().items()}
+        if npz:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp = f"{npz}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    np.savez(f, **arrays)
+                os.replace(tmp, npz)
+            except OSError:
+                pass
+    _EV_SESSIONS_MEM.pop(key, None)
+    while len(_EV_SESSIONS_MEM) >= EV_SESSIONS_MEM_MAX:
+        _EV_SESSIONS_MEM.pop(next(iter(_EV_SESSIONS_MEM)))
+    _EV_SESSIONS_MEM[key] = arrays
+    return {k: v.copy() for k, v in arrays.items()}
+
+
+def ev_library_size(N, block_rows):
+    """
+    Rows of the session library that serves a fleet of N EVs.
+
+    The library is calibrated once and each mix draws its N rows from it, so its size must
+    not depend on the mix: N is rounded up to whole blocks, and every fleet up to
+    `block_rows` EVs shares one library.
+
+    Parameters:
+    - N (int): EVs of the mix.
+    - block_rows (int): Library rows per block.
+
+    Returns:
+    - int: Library rows (a multiple of block_rows, at least one block).
+    """
+    block_rows = max(1, int(block_rows))
+    return block_rows * max(1, -(-int(N) // block_rows))
+
+
+def sample_sessions(library, N, rng):
+    """
+    N rows of a session library, drawn without replacement.
+
+    Parameters:
+    - library (dict): {name: np.ndarray} with one row per session (same row count).
+    - N (int): Rows to draw.
+    - rng (np.random.Generator): Stream of the mix.
+
+    Returns:
+    - dict: {name: np.ndarray} of the drawn rows, in draw order.
+    """
+    n_rows = next(iter(library.values())).shape[0]
+    rows = rng.choice(n_rows, size=int(N), replace=False)
+    return {k: v[rows] for k, v in library.items()}
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Module Name: pfs_feeder_model.py
+Description:
+    Single-pass DSS parser shared by the instantiate script, the deploy runner and the
+    aggregation script. Each DSS file is tokenized once into a compact model:
+        {class: {name: {property: value}}}
+    covering every element defined with New (loads, lines, transformers, vsources,
+    loadshapes, storage, PV, ...). Bracketed/quoted values are kept as one token, '~'
+    continuation lines extend the previous element, comments (! and //) are dropped.
+    Property names are lower-case, values are strings as written; the first occurrence
+    of a repeated property wins (e.g. the first winding's kva) unless set by Edit, and
+    all 'bus' values are also collected into '_buses' (transformers defined winding by
+    winding).
+    Models are cached per file, keyed by a hash of the file content: in memory for the
+    process and as a pickle in CACHE_DIR, so the Lines/Transformers/Loads files a
+    SMART-DS feeder shares across its mixes are parsed once.
+
+Functions:
+    - tokenize_dss_line: Splits one DSS command into (verb, object, properties).
+    - parse_dss_file: Model of one DSS file (uncached).
+    - load_dss_model: Cached, merged model of several DSS files.
+    - load_records: Normalized per-load attributes from a model.
+    - base_name: Load base name without the '_<n>' phase-leg suffix.
+    - dephase: Bus name without phase suffixes, lower-case.
+
+Usage:
+    This module is intended to be imported and used by
+    `power_flow_sim_daily_EV_STO_DG_deploy.py`, `instantiate_circuits_and_runs_APPLYFILTER.py`,
+    `aggregate_m1_m2_with_circuits.py` and `pfs_topology.py`. It is not designed to be executed directly.
+
+Author: Luis F. Victor Gallardo
+Date: 2026/10/18
+Version: 0.1
+"""
+
+import os
+import re
+import pickle
+import hashlib
+
+MODEL_VERSION = 1   # bump when the parsed layout changes (invalidates cached pickles)
+CACHE_DIR = os.environ.get("FEEDER_MODEL_CACHE",
+                           os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                        "_feeder_model_cache"))
+
+MEM_CACHE_MAX = 64  # per-file models kept in memory (oldest dropped first)
+
+_CLOSE = {"(": ")", "[": "]", "{": "}", '"': '"', "'": "'"}
+_MEM_CACHE = {}
+
+
+def _tokens(text):
+    out, i, n = [], 0, len(text)
+    while i < n:
+        c = text[i]
+        if c.isspace() or c == ",":
+            i += 1
+            continue
+        if c == "=":
+            out.append("=")
+            i += 1
+            continue
+        j = i
+        while j < n and not text[j].isspace() and text[j] not in ",=":
+            if text[j] in _CLOSE:
+                # bracketed or quoted group: one token up to the matching close
+                opening, close, depth = text[j], _CLOSE[text[j]], 1
+                j += 1
+                while j < n and depth:
+                    if text[j] == close:
+                        depth -= 1
+                    elif text[j] == opening:
+                        depth += 1
+                    j += 1
+            else:
+                j += 1
+        out.append(text[i:j])
+        i = j
+    return out
+
+
+def tokenize_dss_line(line):
+    """
+    Splits one DSS command line into its verb, object and properties.
+
+    Parameters:
+    - line (str): One line of a DSS file.
+
+    Returns:
+    - tuple or None: (verb, object, props) with verb lower-case ('new', '~', 'edit', ...),
+      object as written ('Load.x', or None) and props a list of (key, value) pairs
+      (key lower-case, None for positional values). None for blank/comment lines.
+    """
+    core = re.split(r"!|//", line, maxsplit=1)[0].strip()
+    if not core:
+        return None
+    if core.startswith("~"):
+        core = "~ " + core[1:]
+    toks = _tokens(core)
+    verb = toks[0].lower()
+    rest = toks[1:]
+    obj = None
+    if verb in ("new", "edit") and rest and rest[0] != "=":
+        obj, rest = rest[0], rest[1:]
+        if obj.lower().startswith("object") and len(rest) >= 2 and rest[0] == "=":
+            obj, rest = rest[1], rest[2:]
+    props, k = [], 0
+    while k < len(rest):
+        if k + 1 < len(rest) and rest[k + 1] == "=":
+            val = rest[k + 2] if k + 2 < len(rest) else ""
+            props.append((rest[k].lower(), val))
+            k += 3
+        else:
+            props.append((None, rest[k]))
+            k += 1
+    return verb, obj, props
+
+
+def _apply_props(el, props, overwrite=False):
+    for key, val in props:
+        if key is None:
+            continue
+        if key == "bus":
+            el.setdefault("_buses", []).append(val)
+        if overwrite:
+            el[key] = val
+        else:
+            el.setdefault(key, val)
+
+
+def parse_dss_file(path):
+    """
+    Parses one DSS file into {class: {name: {property: value}}} (no caching).
+
+    Parameters:
+    - path (str): DSS file.
+
+    Returns:
+    - dict: Model of the elements defined (New) or edited (Edit) in the file.
+    """
+    model = {}
+    last = None
+    editing = False
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for ln in f:
+            parsed = tokenize_dss_line(ln)
+            if parsed is None:
+                continue
+            verb, obj, props = parsed
+            if verb in ("~", "more", "m") and last is not None:
+                _apply_props(last, props, editing)
+                continue
+            if verb not in ("new", "edit") or not obj or "." not in obj:
+                if verb not in ("~", "more", "m"):
+                    last = None
+                continue
+            cls, name = obj.split(".", 1)
+            elements = model.setdefault(cls.lower(), {})
+            if verb == "new" or name not in elements:
+                elements[name] = {}
+            last = elements[name]
+            editing = verb == "edit"
+            _apply_props(last, props, editing)
+    return model
+
+
+def _file_model(path, cache_dir):
+    with open(path, "rb") as f:
+        key = hashlib.sha1(f.read()).hexdigest() + f"_v{MODEL_VERSION}"
+    if key in _MEM_CACHE:
+        return _MEM_CACHE[key]
+    pkl = os.path.join(cache_dir, key + ".pkl") if cache_dir else None
+    model = None
+    if pkl and os.path.exists(pkl):
+        try:
+            with open(pkl, "rb") as f:
+                model = pickle.load(f)
+        except Exception:
+            model = None
+    if model is None:
+        model = parse_dss_file(path)
+        if pkl:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp = f"{pkl}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, pkl)
+            except OSError:
+                pass
+    while len(_MEM_CACHE) >= MEM_CACHE_MAX:
+        _MEM_CACHE.pop(next(iter(_MEM_CACHE)))
+    _MEM_CACHE[key] = model
+    return model
+
+
+def load_dss_model(paths, cache_dir=CACHE_DIR):
+    """
+    Cached model of several DSS files, merged in the given order.
+
+    Parameters:
+    - paths (list): DSS files; missing files are skipped.
+    - cache_dir (str, optional): Folder for the pickled per-file models (None: memory only).
+
+    Returns:
+    - dict: {class: {name: {property: value}}}. A name defined in several files keeps
+      the definition of the last one (as a later New in OpenDSS would). The returned
+      dicts are shared with the cache and must not be modified.
+    """
+    merged = {}
+    for p in paths:
+        p = str(p)
+        if not os.path.exists(p):
+            continue
+        for cls, elements in _file_model(p, cache_dir).items():
+            merged.setdefault(cls, {}).update(elements)
+    return merged
+
+
+def _float_or_none(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_records(model):
+    """
+    Normalized attributes of every load in a model.
+
+    Parameters:
+    - model (dict): Output of `load_dss_model`.
+
+    Returns:
+    - dict: {load name: {'bus1', 'kv', 'phases', 'conn', 'kw', 'kvar', 'daily', 'yearly'}};
+      kw/kvar are floats, conn is lower-case, everything else as written (None if absent).
+    """
+    out = {}
+    for name, p in model.get("load", {}).items():
+        out[name] = {
+            "bus1":   p.get("bus1"),
+            "kv":     p.get("kv"),
+            "phases": p.get("phases"),
+            "conn":   p["conn"].lower() if "conn" in p else None,
+            "kw":     _float_or_none(p.get("kw")),
+            "kvar":   _float_or_none(p.get("kvar")),
+            "daily":  p.get("daily"),
+            "yearly": p.get("yearly"),
+        }
+    return out
+
+
+def base_name(full_name):
+    """'<base>_<n>' → '<base>' (phase-leg suffix of SMART-DS load names)."""
+    return re.sub(r"_[0-9]+$", "", full_name)
+
+
+def dephase(bus_name):
+    """Bus name without phase suffixes ('.1.2.3'), parentheses or quotes, lower-case."""
+    b = bus_name.strip().strip('"').strip("'")
+    return re.split(r"[.\(]", b, maxsplit=1)[0].lower()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Module Name: pfs_timing.py
+Description:
+    Low-overhead phase timing for the deploy runner. The runner is a top-level script, so
+    phases are timed as laps: `lap(name)` charges the time since the previous lap to
+    `name`, and the laps add up to the run's wall time. Work that is spread over a phase
+    (e.g. the peak-kW lookups done while writing the storage/PV files) is timed with the
+    `nested` context manager and reported separately (it is also part of its lap).
+    Each run writes one JSON record (ModifiedCircuitData/run_timing.json) that
+    `run_all_deploys_v2.py` collects into a single table.
+
+Functions:
+    - PhaseTimer: Lap/nested timer that writes the JSON record.
+
+Usage:
+    This module is intended to be imported and used by
+    `power_flow_sim_daily_EV_STO_DG_deploy.py`. It is not designed to be executed directly.
+
+Author: Luis F. Victor Gallardo
+Date: 2026/10/18
+Version: 0.1
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+TIMING_FILE_NAME = "run_timing.json"
+
+
+class PhaseTimer:
+    """
+    Lap timer over time.perf_counter.
+
+    Parameters:
+    - t0 (float, optional): perf_counter value the first lap starts from (default: now).
+    """
+
+    def __init__(self, t0=None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.last = self.t0
+        self.phases = {}
+        self.nested_s = {}
+        self.nested_n = {}
+
+    def lap(self, name):
+        """Charges the time since the previous lap to `name` (accumulates on repeats)."""
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + (now - self.last)
+        self.last = now
+
+    @contextmanager
+    def nested(self, name):
+        """Times a block inside the current lap; totals and call counts go to 'nested'."""
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.nested_s[name] = self.nested_s.get(name, 0.0) + (time.perf_counter() - t)
+            self.nested_n[name] = self.nested_n.get(name, 0) + 1
+
+    def record(self, **meta):
+        """
+        Builds the timing record of the run.
+
+        Parameters:
+        - **meta: Extra fields (folder, backend, counts, ...).
+
+        Returns:
+        - dict: meta fields, 'total_s', 'phases' {name: s} and 'nested' {name: {'s', 'n'}}.
+        """
+        rec = dict(meta)
+        rec["total_s"] = round(time.perf_counter() - self.t0, 4)
+        rec["phases"] = {k: round(v, 4) for k, v in self.phases.items()}
+        rec["nested"] = {k: {"s": round(v, 4), "n": self.nested_n[k]} for k, v in self.nested_s.items()}
+        return rec
+
+    def write_json(self, path, **meta):
+        """
+        Writes `record(**meta)` as JSON.
+
+        Parameters:
+        - path (str): Output file (e.g. ModifiedCircuitData/run_timing.json).
+        - **meta: See `record`.
+
+        Returns:
+        - dict: The written record.
+        """
+        rec = self.record(**meta)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rec, f, indent=2)
+        return rec
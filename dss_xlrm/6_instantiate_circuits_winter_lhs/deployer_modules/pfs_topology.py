@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Module Name: pfs_topology.py
+Description:
+    Compact, array-backed topology of one feeder, built from the shared feeder model
+    (pfs_feeder_model) and shared by the deploy runner and the aggregation script.
+    Buses get integer IDs (names de-phased and lower-case); the graph is stored as CSR
+    adjacency (indptr/indices) with an edge kind per entry (Line, or Transformer linking
+    its windings), next to a transformer table (buses in CSR form, kVA of the first
+    winding) and the source bus (first Vsource). A breadth-first pass from the source
+    gives every bus its parent and depth, which the downstream/depth queries use.
+    Every mix of a feeder shares the same Lines/Transformers/Master files, so the
+    topology is built once per feeder and persisted as an .npz in the feeder model cache
+    folder, keyed by a hash of the line, transformer and source definitions only (so the
+    mix-specific files, e.g. Loads.dss or the runner's edits to Master.dss, do not change
+    the key).
+
+Functions:
+    - FeederTopology: Arrays plus queries (head transformer kVA, downstream buses/loads,
+      depth).
+    - build_topology: Topology of a feeder model (uncached).
+    - load_topology: Cached topology of a set of DSS files.
+
+Usage:
+    This module is intended to be imported and used by
+    `power_flow_sim_daily_EV_STO_DG_deploy.py` and `aggregate_m1_m2_with_circuits.py`.
+    It is not designed to be executed directly.
+
+Author: Luis F. Victor Gallardo
+Date: 2026/10/18
+Version: 0.1
+"""
+
+import os
+import re
+import pickle
+import hashlib
+from collections import deque
+
+import numpy as np
+
+from pfs_feeder_model import CACHE_DIR, load_dss_model, dephase
+
+TOPOLOGY_VERSION = 1   # bump when the stored arrays change (invalidates cached .npz files)
+TOPOLOGY_CLASSES = ("line", "transformer", "vsource")
+
+EDGE_LINE = 0
+EDGE_TRANSFORMER = 1
+
+_ARRAYS = ("bus_names", "indptr", "indices", "edge_kind", "xfmr_names", "xfmr_ptr",
+           "xfmr_bus", "xfmr_kva", "source", "parent", "depth")
+_MEM_CACHE = {}
+
+
+def _bracket_list(value):
+    return [v for v in re.split(r"[,\s]+", value.strip("[]() ").strip()) if v]
+
+
+def _transformer_buses(p):
+    if "buses" in p:
+        names = [dephase(tok) for tok in _bracket_list(p["buses"])]
+    else:
+        names = [dephase(p[key]) for key in ("bus1", "bus2") if key in p]
+        names += [dephase(b) for b in p.get("_buses", [])]
+    return list(dict.fromkeys(names))
+
+
+def _transformer_kva(p):
+    kva_val = None
+    try:
+        kva_val = float(p["kva"]) if "kva" in p else None
+    except ValueError:
+        pass
+    if kva_val is None and "kvas" in p:
+        nums = _bracket_list(p["kvas"])
+        try:
+            kva_val = float(nums[0]) if nums else None
+        except ValueError:
+            pass
+    return np.nan if kva_val is None else kva_val
+
+
+class FeederTopology:
+    """
+    Integer-indexed feeder graph. Build with `build_topology` / `load_topology`.
+
+    Parameters:
+    - arrays (dict): The arrays listed in _ARRAYS (as written by `save`).
+    """
+
+    def __init__(self, arrays):
+        for k in _ARRAYS:
+            setattr(self, k, np.asarray(arrays[k]))
+        self.source = int(self.source)
+        self.bus_index = {b: i for i, b in enumerate(self.bus_names.tolist())}
+        self._children = None
+
+    # ---------- persistence ----------
+    def save(self, path):
+        """Writes the arrays to `path` (.npz, written atomically)."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **{k: getattr(self, k) for k in _ARRAYS})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a topology written by `save`."""
+        with np.load(path, allow_pickle=False) as z:
+            return cls({k: z[k] for k in _ARRAYS})
+
+    # ---------- queries ----------
+    @property
+    def n_buses(self):
+        return int(self.bus_names.size)
+
+    def neighbours(self, bus, kinds=(EDGE_LINE, EDGE_TRANSFORMER)):
+        """
+        Buses one edge away from `bus`.
+
+        Parameters:
+        - bus (int): Bus ID.
+        - kinds (tuple): Edge kinds to follow (EDGE_LINE, EDGE_TRANSFORMER).
+
+        Returns:
+        - np.ndarray: Neighbour bus IDs (unique, sorted).
+        """
+        lo, hi = self.indptr[bus], self.indptr[bus + 1]
+        nb = self.indices[lo:hi][np.isin(self.edge_kind[lo:hi], kinds)]
+        return np.unique(nb)
+
+    def transformer_buses(self, t):
+        """Bus IDs of transformer `t` (row of the transformer table)."""
+        return self.xfmr_bus[self.xfmr_ptr[t]:self.xfmr_ptr[t + 1]]
+
+    def head_transformer_kva(self):
+        """
+        kVA of the substation (head) transformer.
+
+        The first transformer (in definition order) touching the source bus is taken,
+        else the first touching a bus one Line away from it; without a match (or without
+        a source) the largest transformer rating is used.
+
+        Returns:
+        - float or None: kVA of the first winding (None when unknown).
+        """
+        n_x = self.xfmr_kva.size
+        owner = np.repeat(np.arange(n_x), np.diff(self.xfmr_ptr))
+        chosen = None
+        if self.source >= 0:
+            hit = owner[self.xfmr_bus == self.source]
+            if hit.size == 0:
+                near = np.append(self.neighbours(self.source, (EDGE_LINE,)), self.source)
+                hit = owner[np.isin(self.xfmr_bus, near)]
+            if hit.size:
+                chosen = int(hit.min())
+        if chosen is not None:
+            kva = self.xfmr_kva[chosen]
+            return None if np.isnan(kva) else float(kva)
+        if n_x and not np.isnan(self.xfmr_kva).all():
+            return float(np.nanmax(self.xfmr_kva))
+        return None
+
+    def _child_lists(self):
+        if self._children is None:
+            kids = [[] for _ in range(self.n_buses)]
+            for b, p in enumerate(self.parent.tolist()):
+                if p >= 0:
+                    kids[p].append(b)
+            self._children = kids
+        return self._children
+
+    def downstream_buses(self, bus):
+        """
+        Buses fed through `bus` (its subtree in the breadth-first tree from the source).
+
+        Parameters:
+        - bus (int or str): Bus ID or name (names are de-phased).
+
+        Returns:
+        - np.ndarray: Bus IDs, `bus` included (empty when not reachable from the source).
+        """
+        b = self.bus_id(bus)
+        if b is None or self.depth[b] < 0:
+            return np.empty(0, dtype=np.int32)
+        kids = self._child_lists()
+        out, stack = [], [b]
+        while stack:
+            u = stack.pop()
+            out.append(u)
+            stack.extend(kids[u])
+        return np.array(sorted(out), dtype=np.int32)
+
+    def downstream_loads(self, bus, load_buses):
+        """
+        Loads connected downstream of `bus`.
+
+        Parameters:
+        - bus (int or str): Bus ID or name.
+        - load_buses (dict): {load name: bus1} (e.g. from `load_records`); loads vary by
+          mix, so they are passed in rather than stored.
+
+        Returns:
+        - list: Load names, in the order of `load_buses`.
+        """
+        below = set(self.downstream_buses(bus).tolist())
+        return [nm for nm, b1 in load_buses.items()
+                if b1 is not None and self.bus_index.get(dephase(b1)) in below]
+
+    def bus_id(self, bus):
+        """Bus ID of a name (de-phased) or an ID; None when unknown."""
+        if isinstance(bus, str):
+            return self.bus_index.get(dephase(bus))
+        return int(bus)
+
+    def bus_depth(self, bus):
+        """Hops from the source bus (-1 when not reachable or unknown)."""
+        b = self.bus_id(bus)
+        return -1 if b is None else int(self.depth[b])
+
+    def feeder_depth(self):
+        """Largest number of hops from the source bus to any reachable bus."""
+        return int(self.depth.max()) if self.n_buses else 0
+
+
+def build_topology(model):
+    """
+    Builds the topology of a feeder model (no caching).
+
+    Parameters:
+    - model (dict): Output of `load_dss_model` (line, transformer and vsource classes used).
+
+    Returns:
+    - FeederTopology: The feeder graph.
+    """
+    bus_index = {}
+
+    def _id(name):
+        return bus_index.setdefault(name, len(bus_index))
+
+    src, dst, kind = [], [], []
+    for p in model.get("line", {}).values():
+        if "bus1" in p and "bus2" in p:
+            a, b = _id(dephase(p["bus1"])), _id(dephase(p["bus2"]))
+            src += [a, b]; dst += [b, a]; kind += [EDGE_LINE, EDGE_LINE]
+
+    xfmr_names, xfmr_ptr, xfmr_bus, xfmr_kva = [], [0], [], []
+    for name, p in model.get("transformer", {}).items():
+        ids = [_id(b) for b in _transformer_buses(p)]
+        for other in ids[1:]:
+            src += [ids[0], other]; dst += [other, ids[0]]; kind += [EDGE_TRANSFORMER, EDGE_TRANSFORMER]
+        xfmr_names.append(name)
+        xfmr_bus += ids
+        xfmr_ptr.append(len(xfmr_bus))
+        xfmr_kva.append(_transformer_kva(p))
+
+    source = -1
+    for p in model.get("vsource", {}).values():
+        if "bus1" in p:
+            source = _id(dephase(p["bus1"]))
+            break
+
+    n = len(bus_index)
+    src = np.asarray(src, dtype=np.int32)
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    indices = np.asarray(dst, dtype=np.int32)[order]
+    edge_kind = np.asarray(kind, dtype=np.int8)[order]
+
+    # Breadth-first pass from the source: parent and depth of every reachable bus
+    parent = np.full(n, -1, dtype=np.int32)
+    depth = np.full(n, -1, dtype=np.int32)
+    if source >= 0:
+        ptr, nbr = indptr.tolist(), indices.tolist()
+        depth[source] = 0
+        seen = {source}
+        queue = deque([source])
+        while queue:
+            u = queue.popleft()
+            for v in nbr[ptr[u]:ptr[u + 1]]:
+                if v not in seen:
+                    seen.add(v)
+                    parent[v] = u
+                    depth[v] = depth[u] + 1
+                    queue.append(v)
+
+    return FeederTopology({
+        "bus_names": np.array(list(bus_index), dtype=str),
+        "indptr": indptr, "indices": indices, "edge_kind": edge_kind,
+        "xfmr_names": np.array(xfmr_names, dtype=str),
+        "xfmr_ptr": np.asarray(xfmr_ptr, dtype=np.int64),
+        "xfmr_bus": np.asarray(xfmr_bus, dtype=np.int32),
+        "xfmr_kva": np.asarray(xfmr_kva, dtype=float),
+        "source": np.array(source), "parent": parent, "depth": depth,
+    })
+
+
+def load_topology(paths, cache_dir=CACHE_DIR):
+    """
+    Cached topology of the feeder defined by a set of DSS files.
+
+    Parameters:
+    - paths (list): DSS files (missing files are skipped).
+    - cache_dir (str, optional): Folder for the .npz topologies (None: memory only).
+
+    Returns:
+    - FeederTopology: The feeder graph (shared with the cache; do not modify).
+    """
+    model = load_dss_model(paths, cache_dir)
+    topo_model = {cls: model.get(cls, {}) for cls in TOPOLOGY_CLASSES}
+    key = hashlib.sha1(pickle.dumps(topo_model, protocol=4)).hexdigest() + f"_t{TOPOLOGY_VERSION}"
+    if key in _MEM_CACHE:
+        return _MEM_CACHE[key]
+    npz = os.path.join(cache_dir, f"topology_{key}.npz") if cache_dir else None
+    topo = None
+    if npz and os.path.exists(npz):
+        try:
+            topo = FeederTopology.load(npz)
+        except Exception:
+            topo = None
+    if topo is None:
+        topo = build_topology(topo_model)
+        if npz:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                topo.save(npz)
+            except OSError:
+                pass
+    _MEM_CACHE[key] = topo
+    return topo
@@ -13,7 +13,6 @@ Run from inside a prepared circuit folder: ./<STATE>_circuit_<n>_<mix>/
 
 import os, re, sys, csv, time, json, math, shutil, random, cmath
 import numpy as np, pandas as pd
-import comtypes.client as cc
 from copy import deepcopy
 
 # -----------------------
@@ -24,6 +23,11 @@ DEFAULT_EV_L2_PERC   = 0.80
 EV_NOMINAL_POWER_KW  = 7.36
 EV_MAX_EVENTS        = 2
 EV_ERROR_TOL         = 1e-6
+# EV sessions come from a calibrated library shared by every mix (N rows drawn per mix);
+# fleets up to EV_LIBRARY_ROWS EVs share one library, larger ones use whole multiples
+EV_LIBRARY_ROWS      = int(os.environ.get("EV_LIBRARY_ROWS", "2048"))
+# Keep the libraries on disk (ev_sessions_<key>.npz in the feeder model cache folder)
+EV_SESSION_CACHE     = os.environ.get("EV_SESSION_CACHE", "1") == "1"
 
 # Storage sizing vs load peak
 STORAGE_KW_PER_PEAK  = 0.75
@@ -40,6 +44,28 @@ IRR_INTERVAL_H       = 0.25
 
 ACTIVATE_EV          = True
 COMPILE_CIRCUIT      = True
+# Delta mode: compile the base feeder once per engine and apply each mix on top of it
+# (pays off when one process runs many mixes, e.g. run_all_deploys_v2 with BATCH_WORKERS)
+DELTA_MODE           = os.environ.get("DSS_DELTA_MODE", "0") == "1"
+# Write EV/PV shapes as float32 .sng files (mult=(sngfile=...)) instead of inline text
+BINARY_SHAPES        = True
+SHAPES_SUBDIR        = "shapes"
+# Results: "npz" → step the daily solve here and write ModifiedCircuitData/results.npz;
+# "csv" → let Master run its Solve and Export Monitors lines (monitor CSVs)
+RESULTS_FORMAT       = os.environ.get("RESULTS_FORMAT", "npz").lower()
+RESULTS_VOLTAGES     = os.environ.get("RESULTS_VOLTAGES", "0") == "1"   # also store AllBusVmagPu per step
+# Warm start (npz mode): seed each step from the same step of the previous mix of this feeder
+WARM_START           = os.environ.get("DSS_WARM_START", "1") == "1"
+# Peak-window mode (npz mode): solve only the top-k estimated net-load steps and their
+# neighbours; runs with storage always solve the full day. PEAK_VERIFY also runs the full
+# day and records the actual peak error next to the estimate.
+PEAK_MODE            = os.environ.get("DSS_PEAK_MODE", "0") == "1"
+PEAK_TOP_K           = int(os.environ.get("DSS_PEAK_TOP_K", "4"))
+PEAK_NEIGHBOURS      = int(os.environ.get("DSS_PEAK_NEIGHBOURS", "1"))
+PEAK_VERIFY          = os.environ.get("DSS_PEAK_VERIFY", "0") == "1"
+PEAK_MONITOR         = "m2"   # feeder head monitor used for the peak (aggregate_m2_combined.csv)
+# Time-parallel solve (npz mode, no storage): split the daily steps over N forked engine copies
+TIME_WORKERS         = int(os.environ.get("DSS_TIME_WORKERS", "0"))
 
 # -----------------------
 # Helpers
@@ -48,6 +74,7 @@ def read_text(p):  return open(p,'r',encoding='utf-8').read()
 def write_text(p,t): open(p,'w',encoding='utf-8').write(t)
 def read_lines(p): return open(p,'r',encoding='utf-8').readlines()
 def write_lines(p,ls): open(p,'w',encoding='utf-8').writelines(ls)
+def write_sng(p, values): np.asarray(values, dtype='<f4').tofile(p)
 def try_float(x, default=None):
     try: return float(x)
     except Exception: return default
@@ -63,17 +90,26 @@ ROOT        = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
 sys.path.insert(0, os.path.join(ROOT, 'deployer_modules'))
 from pfs_parsing_misc import parse_transformers, parse_lines, parse_loads, can_add_more, update_target_sums, linear_interpolate
 from pfs_file_processing import modify_master_file, modify_dss_files
-from pfs_ev_modeling import generate_initial_charging_sessions, adjust_charging_sessions, balance_demand_with_zero_sessions, adjust_charging_sessions_2, count_charging_cycles
+from pfs_ev_modeling import generate_initial_charging_sessions, adjust_charging_sessions, balance_demand_with_zero_sessions, adjust_charging_sessions_2, count_charging_cycles, ev_sessions_key, load_ev_sessions, ev_library_size, sample_sessions, EV_SEED
 from pfs_ev_plotting import plot_calibration, plot_sessions_heatmap, plot_combined_profile_sessions
 from pfs_heatpump_plotting import plot_combined_heatpump_sessions
 from pfs_write_csv_1 import write_simulation_results_to_csv
 from pfs_ev_base_profiles import process_vehicle_data
 from pfs_hp_base_profiles import generate_heatpump_profiles
+from pfs_engine import get_dss_engine
+from pfs_delta import apply_scenario_delta
+from pfs_results import master_monitors, write_prelude_master, collect_daily_results, collect_daily_results_parallel, save_results_npz
+from pfs_peak import estimate_net_load, select_peak_steps, head_p_3ph, peak_error_estimate
+from pfs_timing import PhaseTimer, TIMING_FILE_NAME
+from pfs_feeder_model import CACHE_DIR, load_dss_model, load_records, base_name
+from pfs_topology import load_topology
+from pfs_assignment import mix_streams
 
 # -----------------------
 # Start
 # -----------------------
 START_TIME     = time.time()
+TIMER          = PhaseTimer()   # per-phase laps → ModifiedCircuitData/run_timing.json
 CIRCUIT_FOLDER = os.path.basename(CURRENT_DIR)
 PROFILES_PATH  = os.path.join('..', 'profiles_use_bench', CIRCUIT_FOLDER)
 
@@ -99,45 +135,30 @@ if os.path.exists(ASSIGN_PATH):
 ev_perc           = clamp01(ASSIGN.get("ev", {}).get("perc", DEFAULT_EV_PERC))
 lvl2_charger_perc = clamp01(ASSIGN.get("ev", {}).get("lvl2_perc", DEFAULT_EV_L2_PERC))
 print(f"EV params → perc={ev_perc:.2f}, L2 share={lvl2_charger_perc:.2f}")
-
-# Read Loads.dss (for bases + daily mapping)
+# Independent random streams of this mix (SeedSequence of the mix EV seed): the draws do
+# not touch the global NumPy state, so mixes run in one process or in parallel give the
+# same numbers as sequential runs
+MIX_SEED          = int(ASSIGN.get("ev", {}).get("seed", EV_SEED))
+RNG               = mix_streams(MIX_SEED)
+TIMER.lap("setup")
+
+# Read Loads.dss once (cached feeder model: bases, daily mapping, EV load attributes)
 PATH_LOADS_DSS       = os.path.join(CIRCUIT_DIR, 'Loads.dss')
 PATH_LOADS_DSS_ORIG  = os.path.join(CIRCUIT_DIR, 'Loads_original.dss')
-loads_content        = read_lines(PATH_LOADS_DSS)
+LOAD_RECORDS         = load_records(load_dss_model([PATH_LOADS_DSS]))
 unique_bases = set(); all_full=set(); base_to_daily={}
-for line in loads_content:
-    if line.strip().lower().startswith("new load."):
-        m_name = re.search(r"New\s+Load\.(\S+)", line, flags=re.IGNORECASE)
-        if not m_name: continue
-        full = m_name.group(1)
-        base = re.sub(r"_[0-9]+$", "", full)
-        if base != "load":
-            unique_bases.add(base)
-        all_full.add(full)
-        m_daily = re.search(r"\bdaily=(\S+)", line, flags=re.IGNORECASE)
-        if m_daily:
-            base_to_daily.setdefault(base, set()).add(m_daily.group(1))
+parsed_loads_map = {}
+for full, rec in LOAD_RECORDS.items():
+    base = base_name(full)
+    if base != "load":
+        unique_bases.add(base)
+    all_full.add(full)
+    if rec["daily"]:
+        base_to_daily.setdefault(base, set()).add(rec["daily"])
+    parsed_loads_map[full] = {"bus1": rec["bus1"], "kV": rec["kv"], "ph": rec["phases"], "conn": rec["conn"]}
 unique_loads_list = sorted(unique_bases)
 print(f"Found {len(unique_loads_list)} unique base loads.")
-
-# Parsed attributes for EV loads
-parsed_loads_map = {}
-for line in read_lines(os.path.join(CIRCUIT_DIR, "Loads.dss")):
-    s = line.strip()
-    if not s.lower().startswith("new load."): continue
-    m = re.search(r"New\s+Load\.(\S+)", s)
-    if not m: continue
-    name = m.group(1)
-    bus  = re.search(r"bus1=([\w\.\-]+)", s)
-    kv   = re.search(r"kV=([\d\.Ee+-]+)", s)
-    ph   = re.search(r"phases=(\d+)", s.lower())
-    conn = re.search(r"conn=(\w+)", s.lower())
-    parsed_loads_map[name] = {
-        "bus1": bus.group(1) if bus else None,
-        "kV":   kv.group(1)  if kv  else None,
-        "ph":   ph.group(1)  if ph  else None,
-        "conn": conn.group(1) if conn else None,
-    }
+TIMER.lap("loads_parse")
 
 def ensure_redirects_before_solve(master_path):
     """
@@ -284,52 +305,83 @@ def retarget_master_to_daily(master_path, npts=96, stepsize="15m", comment_plots
         write_lines(master_path, out)
     return changed
 
+PEAK_INDEX_PATH = os.path.join(PROFILES_PATH, "peak_index.json")
+PEAK_INDEX = None
+
+def profile_peak_kw(dn):
+    """Peak of a consolidated daily profile (.sng, else CSV), or None if missing."""
+    sng_path = os.path.join(PROFILES_PATH, f"{dn}.sng")
+    if os.path.exists(sng_path):
+        try:
+            return float(np.fromfile(sng_path, dtype='<f4').max())
+        except Exception:
+            pass
+    csv_path = os.path.join(PROFILES_PATH, f"{dn}.csv")
+    if os.path.exists(csv_path):
+        try:
+            df = pd.read_csv(csv_path, header=None)
+            return float(df[0].max())
+        except Exception:
+            pass
+    return None
+
+def get_peak_index():
+    """peak_index.json written by instantiate; rebuilt here once for older folders."""
+    global PEAK_INDEX
+    if PEAK_INDEX is None:
+        if os.path.exists(PEAK_INDEX_PATH):
+            PEAK_INDEX = json.loads(read_text(PEAK_INDEX_PATH))
+        else:
+            dailies = sorted({dn for dns in base_to_daily.values() for dn in dns})
+            PEAK_INDEX = {
+                "shape_peak_kw": {dn: pk for dn in dailies for pk in [profile_peak_kw(dn)] if pk is not None},
+                "load_kw": {nm: rec["kw"] for nm, rec in load_records(load_dss_model([PATH_LOADS_DSS_ORIG])).items()
+                            if rec["kw"] is not None},
+            }
+    return PEAK_INDEX
+
 def peak_kw_for_load(full_name):
-    """Try consolidated CSV (peak of daily), else original kW, else tiny fallback."""
-    base = re.sub(r"_[0-9]+$", "", full_name)
-    for dn in sorted(base_to_daily.get(base, set())):
-        csv_path = os.path.join(PROFILES_PATH, f"{dn}.csv")
-        if os.path.exists(csv_path):
-            try:
-                df = pd.read_csv(csv_path, header=None)
-                return float(df[0].max())
-            except Exception:
-                pass
-    if os.path.exists(PATH_LOADS_DSS_ORIG):
-        for line in read_lines(PATH_LOADS_DSS_ORIG):
-            if f"New Load.{full_name}" in line:
-                m_kw = re.search(r"\bkW=([0-9\.Ee+-]+)", line)
-                if m_kw: 
-                    v = try_float(m_kw.group(1), None)
-                    if v is not None: return v
-    return 10.0
+    """Peak of the load's daily profile, else its original kW, else tiny fallback (index lookups)."""
+    with TIMER.nested("peak_kw_lookup"):
+        index = get_peak_index()
+        for dn in sorted(base_to_daily.get(base_name(full_name), set())):
+            if dn in index["shape_peak_kw"]:
+                return index["shape_peak_kw"][dn]
+        return index["load_kw"].get(full_name, 10.0)
 
 # ---------------- EV profiles (both types) ----------------
 if ACTIVATE_EV:
     # base EV demand input (from ./data_ev copied at instantiate)
+    TIMER.lap("helpers")
     avg_15 = process_vehicle_data(CURRENT_DIR, ev_profile_version='without_pif', test_compare_ev_input_profiles=True)
+    TIMER.lap("process_vehicle_data")
 
-    def generate_ev_profiles(avg_demand, load_number_resi, ev_p, l2_p, nominal_power, max_events, err_tol):
-        avg_demand = np.array(deepcopy(avg_demand))
-        N = int(load_number_resi * ev_p * l2_p)
+    def calibrate_ev_sessions(sessions, avg_demand, nominal_power, max_events, err_tol, rng):
+        # Calibrate sessions (N, T) against the per-EV average demand, in place
+        N, T = sessions.shape
+        if N == 0:
+            return sessions, np.zeros(0, dtype=bool)
         min_power = nominal_power * 0.9
-        T = len(avg_demand)
-        sessions = generate_initial_charging_sessions(N, T, nominal_power, min_power, max_events, avg_demand)
         sessions = adjust_charging_sessions(sessions, avg_demand, N, nominal_power, T, err_tol)
-        sessions = adjust_charging_sessions_2(sessions, avg_demand, N, nominal_power, T, err_tol, max_events, min_power)
-        # Fill completely zero rows if any (simple equal-energy fill on available intervals)
-        zero_rows = np.where(np.all(sessions == 0, axis=1))[0]
-        if len(zero_rows) > 0:
+        sessions = adjust_charging_sessions_2(sessions, avg_demand, N, nominal_power, T, err_tol, max_events, min_power, rng)
+        # EVs the bounded repair could not place (no interval with headroom): simple
+        # equal-energy fill on the active intervals, above the bound
+        zero_rows = np.flatnonzero(~sessions.any(axis=1))
+        if zero_rows.size > 0:
+            print(f"  • EV repair: {zero_rows.size}/{N} EVs found no interval under the upper bound → equal-energy fill")
             avg_profile = np.mean(sessions, axis=0)
             nz = np.flatnonzero(avg_profile)
-            for idx in zero_rows:
-                if nz.size > 0:
-                    sessions[idx, nz] = (avg_profile[nz].sum() / len(nz))
-        return sessions
+            if nz.size > 0:
+                sessions[np.ix_(zero_rows, nz)] = avg_profile[nz].sum() / nz.size
+        unplaced = np.zeros(N, dtype=bool)
+        unplaced[zero_rows] = True
+        return sessions, unplaced
 
-    # Generate base set (uncontrolled); make a controlled version by equal-energy reshaping
-    arr_ev_all_unctl = generate_ev_profiles(avg_15, len(unique_loads_list), ev_perc, lvl2_charger_perc,
-                                           EV_NOMINAL_POWER_KW, EV_MAX_EVENTS, EV_ERROR_TOL)
+    def generate_ev_profiles(avg_demand, N, nominal_power, max_events, err_tol, rng):
+        avg_demand = np.array(deepcopy(avg_demand))
+        sessions = generate_initial_charging_sessions(N, len(avg_demand), nominal_power, nominal_power * 0.9,
+                                                      max_events, avg_demand, rng)
+        return calibrate_ev_sessions(sessions, avg_demand, nominal_power, max_events, err_tol, rng)
 
     def equal_energy_realloc(profiles):
         P = profiles.copy()
@@ -343,10 +395,32 @@ if ACTIVATE_EV:
             out[i, nz] = e / len(nz)
         return out
 
+    # Session library: calibrated once per demand profile, library size and the knobs above,
+    # from a fixed seed (EV_SEED), so every mix shares it and it is read from the cache after
+    # the first run. Each mix draws its N rows with its own stream RNG["ev"]; a random subset
+    # of the library is not calibrated itself (its mean drifts far from avg_15 for small
+    # fleets), so the drawn rows are calibrated again, then the controlled version is made
+    # by equal-energy reshaping.
+    # Bump EV_SESSIONS_VERSION (pfs_ev_modeling) when editing the functions above.
+    N_EV = int(len(unique_loads_list) * ev_perc * lvl2_charger_perc)
+    EV_LIBRARY_N = ev_library_size(N_EV, EV_LIBRARY_ROWS)
+
+    def build_ev_library():
+        unctl, _ = generate_ev_profiles(avg_15, EV_LIBRARY_N, EV_NOMINAL_POWER_KW, EV_MAX_EVENTS,
+                                        EV_ERROR_TOL, np.random.default_rng(EV_SEED))
+        return {"unctl": unctl}
+
+    EV_KEY = ev_sessions_key(avg_15, EV_LIBRARY_N, EV_NOMINAL_POWER_KW, EV_MAX_EVENTS, EV_ERROR_TOL, EV_SEED)
+    ev_lib = load_ev_sessions(EV_KEY, build_ev_library, CACHE_DIR if EV_SESSION_CACHE else None)
+    ev_drawn = sample_sessions(ev_lib, N_EV, RNG["ev"])["unctl"]
+    arr_ev_all_unctl, ev_unplaced_rows = calibrate_ev_sessions(ev_drawn, np.array(deepcopy(avg_15)), EV_NOMINAL_POWER_KW,
+                                                               EV_MAX_EVENTS, EV_ERROR_TOL, RNG["ev"])
     arr_ev_all_ctl = equal_energy_realloc(arr_ev_all_unctl)
+    EV_UNPLACED = int(ev_unplaced_rows.sum())
 else:
     arr_ev_all_unctl = np.zeros((0, IRRADIANCE_NPTS))
     arr_ev_all_ctl   = np.zeros((0, IRRADIANCE_NPTS))
+    EV_UNPLACED = 0
 
 # ---------------- EV host lists from JSON ----------------
 json_ev_un = ASSIGN.get("ev_loads_uncontrolled", []) if isinstance(ASSIGN, dict) else []
@@ -375,6 +449,13 @@ def ensure_rows(mat, N_target):
 
 arr_u = ensure_rows(arr_ev_all_unctl, N_u)
 arr_c = ensure_rows(arr_ev_all_ctl,   N_c)
+TIMER.lap("ev_sessions")
+
+# Feeder topology (shared by every mix of the feeder; cached for the aggregation step too)
+TOPOLOGY = load_topology([os.path.join(CIRCUIT_DIR, fn) for fn in ('Lines.dss', 'Transformers.dss', 'Master.dss')])
+HEAD_XFMR_KVA = TOPOLOGY.head_transformer_kva()
+print(f"Topology: {TOPOLOGY.n_buses} buses, depth {TOPOLOGY.feeder_depth()}, head transformer {HEAD_XFMR_KVA} kVA")
+TIMER.lap("topology")
 
 # ---------------- Prepare scenario dir ----------------
 OUT_DIR = os.path.join(CURRENT_DIR, "ModifiedCircuitData")
@@ -396,8 +477,8 @@ for fn in dss_files:
     if fn == 'LoadShapes.dss':
         lines = read_lines(dst)
         upd = []
-        needle = f"file=../profiles_use_bench/{CIRCUIT_FOLDER}/"
-        repl   = f"file=../../profiles_use_bench/{CIRCUIT_FOLDER}/"
+        needle = "file=../profiles_use_bench/"      # per-folder copies and the shared _store/
+        repl   = "file=../../profiles_use_bench/"
         for ln in lines:
             upd.append(ln.replace(needle, repl))
         write_lines(dst, upd)
@@ -406,16 +487,34 @@ for fn in dss_files:
 loads_ev_path      = os.path.join(OUT_DIR, "Loads.dss")          # append into existing
 loadshapes_ev_path = os.path.join(OUT_DIR, "LoadShapes_EV.dss")  # new EV shapes file
 
+shapes_dir = os.path.join(OUT_DIR, SHAPES_SUBDIR)
+if BINARY_SHAPES:
+    os.makedirs(shapes_dir, exist_ok=True)
+
+def shape_mult(name, row, decimals=4):
+    """
+    mult=(...) value for a loadshape: a .sng file under OUT_DIR/shapes, or inline text.
+    `decimals` rounds the values as the text form of the shape did (EV rows: 4 decimals;
+    None: unrounded, e.g. the irradiance curve, formerly written with str()).
+    """
+    values = row if decimals is None else np.round(row, decimals)
+    if BINARY_SHAPES:
+        write_sng(os.path.join(shapes_dir, f"{name}.sng"), values)
+        return f"(sngfile={SHAPES_SUBDIR}/{name}.sng)"
+    if decimals is None:
+        return "(" + " ".join(str(v) for v in row) + ")"
+    return f"({' '.join(f'{v:.{decimals}f}' for v in row)})"
+
 if ACTIVATE_EV and (N_u + N_c) > 0:
     # EV loadshapes: uncontrolled → EVu_i, controlled → EVc_i
     with open(loadshapes_ev_path, "w") as f_ls:
         f_ls.write("! EV LoadShapes (uncontrolled + controlled)\n\n")
         for i in range(N_u):
             row = arr_u[i, :]
-            f_ls.write(f"New Loadshape.EVu_{i} npts={row.size} interval=0.25 mult=({' '.join(f'{v:.4f}' for v in row)})\n")
+            f_ls.write(f"New Loadshape.EVu_{i} npts={row.size} interval=0.25 mult={shape_mult(f'EVu_{i}', row)}\n")
         for i in range(N_c):
             row = arr_c[i, :]
-            f_ls.write(f"New Loadshape.EVc_{i} npts={row.size} interval=0.25 mult=({' '.join(f'{v:.4f}' for v in row)})\n")
+            f_ls.write(f"New Loadshape.EVc_{i} npts={row.size} interval=0.25 mult={shape_mult(f'EVc_{i}', row)}\n")
 
     # Append EV loads (two legs _1/_2) using attributes from parsed_loads_map
     with open(loads_ev_path, "a") as f_ld:
@@ -560,7 +659,11 @@ if PV_KW_PER_PEAK > 0.0 and pv_targets:
         f_ls.write("! PV LoadShapes\n\n")
         season = (ASSIGN.get("season") or "summer").lower()
         profile = irradiance_summer_padded if season == "summer" else irradiance_winter_padded
-        prof_str = " ".join(str(v) for v in profile)
+        if BINARY_SHAPES:
+            # every PV shape is the same irradiance curve → one shared binary file
+            pv_mult = shape_mult("PVShape", profile, decimals=None)
+        else:
+            pv_mult = "(" + " ".join(str(v) for v in profile) + ")"
 
         for idx, full in enumerate(pv_targets):
             info = parsed_loads_map.get(full)
@@ -573,7 +676,7 @@ if PV_KW_PER_PEAK > 0.0 and pv_targets:
             bus_str = f"{busname}.1.2.3" if ph == "3" else info["bus1"]
             ls_name = f"PVShape_{idx}"
             pv_name = f"pv_{full}"
-            f_ls.write(f"New Loadshape.{ls_name} npts={IRRADIANCE_NPTS} interval={IRR_INTERVAL_H} mult=({prof_str})\n")
+            f_ls.write(f"New Loadshape.{ls_name} npts={IRRADIANCE_NPTS} interval={IRR_INTERVAL_H} mult={pv_mult}\n")
             f_pv.write(
                 f"New PVSystem.{pv_name} phases={ph} bus1={bus_str} kV={info['kV']} "
                 f"kVA={pv_kw*1.1:.1f} pmpp={pv_kw:.1f} pf=1 %Cutin=0.1 %Cutout=0.1 effcurve=myEff "
@@ -618,10 +721,12 @@ if master_dss_path:
     '''
 
 # ---------------- Compile & Solve ----------------
-DSSobj   = cc.CreateObject("OpenDSSEngine.DSS")
-DSSstart = DSSobj.Start(0)
-DSStext  = DSSobj.Text
-DSScircuit = DSSobj.ActiveCircuit
+# one engine per process (reused across folders when run by the batch worker pool);
+# the backend (COM on Windows, DSS C-API headless) comes from DSS_BACKEND
+TIMER.lap("dss_write")
+ENGINE = get_dss_engine()
+print(f"DSS backend: {ENGINE.backend}")
+TIMER.lap("engine_start")
 
 if COMPILE_CIRCUIT and master_dss_path:
     '''
@@ -630,8 +735,67 @@ if COMPILE_CIRCUIT and master_dss_path:
     DSScircuit.Solution.Solve()
     print(f"Scenario (mixed EV) solved. Converged? {DSScircuit.Solution.Converged}")
     '''
-    # Compile first
-    DSStext.Command = f'Compile "{master_dss_path}"'
+    step_here = (RESULTS_FORMAT == "npz")
+    if DELTA_MODE:
+        # Base feeder stays compiled in the engine; only this mix's files are applied
+        compiled_base = apply_scenario_delta(ENGINE, master_dss_path, run_tail=not step_here)
+        print(f"Delta mode: {'compiled base feeder + ' if compiled_base else ''}applied scenario delta")
+    else:
+        # Compile first (clears whatever a previous scenario left in a reused engine)
+        ENGINE.compile(write_prelude_master(master_dss_path) if step_here else master_dss_path)
+    TIMER.lap("compile")   # csv mode: includes Master's Solve and Export lines
+
+    if step_here:
+        monitors = master_monitors(master_dss_path)
+        head = PEAK_MONITOR if any(m["name"] == PEAK_MONITOR for m in monitors) else (monitors[0]["name"] if monitors else None)
+        peak_steps = net_est = None
+        if PEAK_MODE:
+            net_est = estimate_net_load(OUT_DIR, npts=IRRADIANCE_NPTS)
+            if n_storage > 0:
+                print("Peak mode: storage present (steps depend on each other) → full day")
+            elif net_est is None or head is None:
+                print("Peak mode: net load estimate or head monitor unavailable → full day")
+            else:
+                peak_steps = select_peak_steps(net_est, PEAK_TOP_K, PEAK_NEIGHBOURS)
+
+        res = None
+        if TIME_WORKERS > 1 and not storage_targets and n_storage == 0:
+            # No storage → the steps are independent snapshots; solve chunks of the day in parallel
+            try:
+                res = collect_daily_results_parallel(ENGINE, monitors, storage_names, TIME_WORKERS,
+                                                     npts=IRRADIANCE_NPTS, stepsize="15m",
+                                                     with_voltages=RESULTS_VOLTAGES, steps=peak_steps)
+            except Exception as e:
+                print(f"⚠️ Time-parallel solve failed ({e}); solving sequentially")
+            if res is not None:
+                print(f"Time-parallel solve: {TIME_WORKERS} processes")
+        if res is None:
+            # Step the daily run and read feeder head / storage / voltages straight from the engine
+            res = collect_daily_results(ENGINE, monitors, storage_names,
+                                        npts=IRRADIANCE_NPTS, stepsize="15m", with_voltages=RESULTS_VOLTAGES,
+                                        warm_start=WARM_START, steps=peak_steps)
+        if peak_steps is not None:
+            p_head = head_p_3ph(res, head)
+            err_est = peak_error_estimate(net_est, p_head, peak_steps)
+            peak_info = {"peak_steps": np.array(peak_steps, dtype=np.int32), "peak_estimate_kw": net_est,
+                         "peak_kw": np.array(np.nanmax(p_head)), "peak_error_est_kw": np.array(err_est)}
+            print(f"Peak mode: solved {len(peak_steps)}/{IRRADIANCE_NPTS} steps, "
+                  f"peak {float(np.nanmax(p_head)):.1f} kW (estimated error +{err_est:.1f} kW)")
+            if PEAK_VERIFY:
+                res = collect_daily_results(ENGINE, monitors, storage_names,
+                                            npts=IRRADIANCE_NPTS, stepsize="15m", with_voltages=RESULTS_VOLTAGES)
+                full_peak = float(np.nanmax(head_p_3ph(res, head)))
+                peak_info["peak_full_kw"]  = np.array(full_peak)
+                peak_info["peak_error_kw"] = np.array(full_peak - float(peak_info["peak_kw"]))
+                print(f"Peak mode check: full-day peak {full_peak:.1f} kW "
+                      f"(error {float(peak_info['peak_error_kw']):.2f} kW)")
+            res.update(peak_info)
+        TIMER.lap("solve")
+        save_results_npz(os.path.join(OUT_DIR, "results.npz"), res)
+        TIMER.lap("export")
+        print(f"Results → {os.path.join(OUT_DIR, 'results.npz')} "
+              f"(steps not converged: {int((~res['converged']).sum())}, iterations: {int(res['iterations'].sum())}, "
+              f"warm start: {'previous mix' if res['warm_started'] else 'previous step'})")
 
     '''
     # Force DAILY time-series: 96 × 15-minute steps
@@ -652,9 +816,14 @@ if COMPILE_CIRCUIT and master_dss_path:
 
     # Run the 96-step daily simulation
     # DSScircuit.Solution.Solve()
-    print(f"Converged? {DSScircuit.Solution.Converged}")
+    print(f"Converged? {ENGINE.converged}")
 
 
 print("✅ Finished single-scenario deploy.")
+TIMER.lap("finish")
+TIMER.write_json(os.path.join(OUT_DIR, TIMING_FILE_NAME), folder=CIRCUIT_FOLDER, backend=ENGINE.backend,
+                 results_format=RESULTS_FORMAT, delta_mode=DELTA_MODE, n_loads=len(unique_loads_list),
+                 n_ev=N_u + N_c, ev_unplaced=EV_UNPLACED, n_storage=n_storage, n_pv=n_pv,
+                 n_buses=TOPOLOGY.n_buses, feeder_depth=TOPOLOGY.feeder_depth(), head_xfmr_kva=HEAD_XFMR_KVA)
 print(f"Time taken: {time.time() - START_TIME:.2f} s")
 sys.exit(0)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Module Name: pfs_engine.py
+Description:
+    Pluggable OpenDSS engine used by the deploy runner. The runner only talks to the
+    small `DSSEngine` interface (compile, solve, text commands, monitors, element
+    access); the backend behind it is chosen with the DSS_BACKEND environment variable:
+        - "com":      OpenDSSEngine.DSS through comtypes (Windows only)
+        - "dss_capi": in-process DSS C-API through dss_python (also installed by
+                      OpenDSSDirect.py); runs headless on Linux
+    Creating an engine costs a noticeable share of every deploy run, so the engine is
+    created once per Python process and reused by every scenario that process runs
+    (see the worker pool in `run_all_deploys_v2.py`).
+
+Functions:
+    - get_dss_engine: Returns the cached engine of this process, creating it on first use.
+    - create_engine: Builds a new engine for a given backend name.
+
+Usage:
+    This module is intended to be imported and used by
+    `power_flow_sim_daily_EV_STO_DG_deploy.py`. It is not designed to be executed directly.
+
+Author: Luis F. Victor Gallardo
+Date: 2026/10/18
+Version: 0.3
+"""
+
+import os
+import ctypes
+import numpy as np
+
+DSS_BACKENDS = ("com", "dss_capi")
+DEFAULT_DSS_BACKEND = "com" if os.name == "nt" else "dss_capi"
+
+_DSS_ENGINE = None
+
+
+class DSSEngine:
+    """
+    Thin wrapper over a COM-compatible OpenDSS object. Both backends expose the same
+    object model (Text, ActiveCircuit, Solution, Monitors, CktElement), so the wrapper
+    is shared and only the construction differs.
+    """
+
+    def __init__(self, dss_obj, backend):
+        self.dss = dss_obj
+        self.backend = backend
+        # delta-mode bookkeeping (see pfs_delta): key of the compiled base feeder, the
+        # scenario elements currently defined on top of it ({lower name: name}) and those
+        # left disabled by earlier scenarios
+        self.base_key = None
+        self.delta_elements = {}
+        self.disabled_elements = set()
+        self.dss.Start(0)
+        try:
+            self.dss.AllowForms = False  # never pop message boxes from a batch worker
+        except Exception:
+            pass
+
+    # ---- text interface ----
+    def text(self, command):
+        """Runs one DSS command and returns its result string."""
+        self.dss.Text.Command = command
+        return self.dss.Text.Result
+
+    # ---- circuit lifecycle ----
+    def compile(self, master_path):
+        """Clears the engine and compiles a Master file (runs any Solve inside it)."""
+        self.text("Clear")
+        self.base_key = None
+        self.delta_elements = {}
+        self.disabled_elements = set()
+        self.text(f'Compile "{master_path}"')
+
+    @property
+    def circuit(self):
+        return self.dss.ActiveCircuit
+
+    @property
+    def solution(self):
+        return self.dss.ActiveCircuit.Solution
+
+    def solve(self):
+        self.solution.Solve()
+
+    @property
+    def converged(self):
+        return bool(self.solution.Converged)
+
+    # ---- monitors ----
+    def export_monitor(self, name):
+        """Exports one monitor to CSV in the data path and returns the file name."""
+        return self.text(f"Export Monitors {name}")
+
+    def monitor_channels(self, name):
+        """Returns {channel header: list of values} for a monitor."""
+        mons = self.circuit.Monitors
+        mons.Name = name
+        headers = [h.strip() for h in mons.Header]
+        return {h: list(mons.Channel(i + 1)) for i, h in enumerate(headers)}
+
+    # ---- element access ----
+    def element(self, full_name):
+        """Activates an element (e.g. 'Line.l1') and returns the active CktElement."""
+        self.circuit.SetActiveElement(full_name)
+        return self.circuit.ActiveCktElement
+
+    def element_powers(self, full_name):
+        """Returns the flat [P1, Q1, P2, Q2, ...] kW/kvar list of an element."""
+        return list(self.element(full_name).Powers)
+
+    def bus_vmag_pu(self):
+        """Returns the per-unit voltage magnitude of every bus node."""
+        return list(self.circuit.AllBusVmagPu)
+
+    # ---- solver state ----
+    def node_voltages_view(self):
+        """
+        Returns a complex NumPy view over the solver's node voltage vector (index 0 is the
+        ground node), or None when the backend does not expose it. Only the DSS C-API
+        backend does (YMatrix V pointer); writing into the view before a Solve sets the
+        starting point of that solve. Fetch a fresh view before every use: the vector is
+        reallocated when buses are redefined.
+        """
+        ym = getattr(self.dss, "YMatrix", None)
+        get_ptr = getattr(ym, "GetVPointer", None) or getattr(ym, "getVpointer", None)
+        if get_ptr is None:
+            return None
+        try:
+            ptr = int(get_ptr())
+            n = int(self.circuit.NumNodes) + 1
+        except Exception:
+            return None
+        if not ptr:
+            return None
+        buf = (ctypes.c_double * (2 * n)).from_address(ptr)
+        return np.frombuffer(buf, dtype=np.complex128)
+
+    @property
+    def solution_initialized(self):
+        """False right after a compile (next solve starts from a zero-load snapshot)."""
+        ym = getattr(self.dss, "YMatrix", None)
+        try:
+            return bool(ym.SolutionInitialized)
+        except Exception:
+            return True
+
+
+def create_engine(backend=None):
+    """
+    Builds and starts a new engine.
+
+    Parameters:
+    - backend (str, optional): "com" or "dss_capi". Defaults to DSS_BACKEND from the
+      environment, else "com" on Windows and "dss_capi" elsewhere.
+
+    Returns:
+    - DSSEngine: The started engine.
+    """
+    backend = (backend or os.environ.get("DSS_BACKEND") or DEFAULT_DSS_BACKEND).strip().lower()
+    if backend == "com":
+        import comtypes.client as cc
+        return DSSEngine(cc.CreateObject("OpenDSSEngine.DSS"), backend)
+    if backend == "dss_capi":
+        from dss import DSS as dss_capi_engine  # dss_python (a dependency of OpenDSSDirect.py)
+        return DSSEngine(dss_capi_engine, backend)
+    raise ValueError(f"Unknown DSS_BACKEND '{backend}' (expected one of {DSS_BACKENDS})")
+
+
+def get_dss_engine(backend=None):
+    """
+    Returns the OpenDSS engine of this process, creating and starting it on first use.
+
+    Parameters:
+    - backend (str, optional): See `create_engine`. Only used on first call.
+
+    Returns:
+    - DSSEngine: The cached engine.
+    """
+    global _DSS_ENGINE
+    if _DSS_ENGINE is None:
+        _DSS_ENGINE = create_engine(backend)
+    return _DSS_ENGINE
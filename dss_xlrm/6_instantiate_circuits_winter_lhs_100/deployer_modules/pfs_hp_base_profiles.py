@@ -39,7 +39,7 @@ def linear_interpolate(start_val, end_val, num_intervals=4):
     return [start_val + (end_val - start_val) * (i / num_intervals) for i in range(1, num_intervals)]
 
 
-def generate_heatpump_profiles(LOAD_NUMBER, HP_PERC, MONTH, DAY, TEMP_RANGE_MIN, TEMP_RANGE_MAX, DF_HP_CSV_PATH):
+def generate_heatpump_profiles(LOAD_NUMBER, HP_PERC, MONTH, DAY, TEMP_RANGE_MIN, TEMP_RANGE_MAX, DF_HP_CSV_PATH, rng=None):
     """
     Generates heat pump profiles based on the specified parameters.
 
@@ -50,6 +50,8 @@ def generate_heatpump_profiles(LOAD_NUMBER, HP_PERC, MONTH, DAY, TEMP_RANGE_MIN,
     - DAY: The day for filtering the data.
     - TEMP_RANGE_MIN: The minimum temperature range for filtering.
     - TEMP_RANGE_MAX: The maximum temperature range for filtering.
+    - rng: Optional numpy Generator the heat pumps are drawn from (default: one
+      RandomState per profile, seeded 42 + profile index).
 
     Returns:
     - A tuple containing the profiles matrix and the list of selected heat pumps.
@@ -101,7 +103,8 @@ def generate_heatpump_profiles(LOAD_NUMBER, HP_PERC, MONTH, DAY, TEMP_RANGE_MIN,
         random_seed = initial_seed + i
 
         # Randomly select one 'Heat Pump' value from filtered_groups
-        selected_heat_pump = filtered_groups['Heat Pump'].sample(n=1, random_state=np.random.RandomState(random_seed)).values[0]
+        random_state = np.random.RandomState(random_seed) if rng is None else rng
+        selected_heat_pump = filtered_groups['Heat Pump'].sample(n=1, random_state=random_state).values[0]
         list_selected_heat_pump.append(selected_heat_pump)
         filtered_groups_hp_chosen = filtered_groups[(filtered_groups['Heat Pump'] == selected_heat_pump)]
 
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Module Name: pfs_peak.py
+Description:
+    Peak-window mode for the deploy runner. The primary metric is the peak of the feeder
+    head demand, so most of the 96 daily steps do not matter for it. This module estimates
+    the net load of every step from the scenario files (no power flow):
+        net[k] = Σ_loads kW × mult_daily[k]  −  Σ_pv Pmpp × irradiance × mult_daily[k]
+    The loads cover base, heat pump and EV loads (all defined in Loads.dss with a daily
+    shape). Only the top-k steps of that estimate and their neighbours are then solved.
+    After the solve, the ratio between solved head P and estimate on the solved steps
+    gives an estimate (not a guaranteed bound) of the peak the skipped steps could still
+    hold; DSS_PEAK_VERIFY in the runner measures the actual error against the full day.
+    Storage makes the steps depend on each other (state of charge, controller targets),
+    so runs with storage fall back to the full day.
+
+Functions:
+    - read_loadshapes: Reads the mult arrays of every Loadshape defined in DSS files.
+    - estimate_net_load: Net load estimate per step for one scenario folder.
+    - select_peak_steps: Top-k estimate steps plus their neighbours.
+    - head_p_3ph: Three-phase P of a monitor from collected results.
+    - peak_error_estimate: Estimate of the peak missed by the skipped steps.
+
+Usage:
+    This module is intended to be imported and used by
+    `power_flow_sim_daily_EV_STO_DG_deploy.py`. It is not designed to be executed directly.
+
+Author: Luis F. Victor Gallardo
+Date: 2026/10/18
+Version: 0.1
+"""
+
+import os
+import re
+import numpy as np
+
+# Scenario files read for the estimate (relative to ModifiedCircuitData)
+SHAPE_FILES = ("LoadShapes.dss", "LoadShapes_EV.dss", "LoadShapes_PV.dss")
+LOAD_FILES  = ("Loads.dss",)
+PV_FILES    = ("PVSystems.dss",)
+
+
+def _prop(line, name):
+    m = re.search(rf'(?i)\b{name}\s*=\s*([^\s]+)', line)
+    return m.group(1) if m else None
+
+
+def _read_mult(line, base_dir, npts):
+    m = re.search(r'(?i)(?<!q)\bmult\s*=\s*[\(\[]\s*(.*?)\s*[\)\]]', line)
+    if not m:
+        return None
+    body = m.group(1)
+    m_file = re.match(r'(?i)(sngfile|dblfile|file)\s*=\s*"?([^"\s\)]+)"?', body)
+    if m_file:
+        kind, path = m_file.group(1).lower(), m_file.group(2)
+        path = path if os.path.isabs(path) else os.path.join(base_dir, path)
+        if kind == "sngfile":
+            vals = np.fromfile(path, dtype='<f4')
+        elif kind == "dblfile":
+            vals = np.fromfile(path, dtype='<f8')
+        else:
+            vals = np.atleast_1d(np.genfromtxt(path, delimiter=',', usecols=0))
+    else:
+        vals = np.array([float(v) for v in re.split(r'[\s,]+', body) if v])
+    vals = np.asarray(vals, dtype=float)
+    if vals.size < npts:
+        return None
+    return vals[:npts]
+
+
+def read_loadshapes(dss_paths, npts=96):
+    """
+    Reads the mult array of every Loadshape defined (one per line) in the given files.
+
+    Parameters:
+    - dss_paths (list): DSS files to scan; missing files are skipped.
+    - npts (int): Number of points to keep per shape.
+
+    Returns:
+    - dict: {lower-case shape name: np.ndarray of length npts}. Shapes whose data cannot
+      be read are left out.
+    """
+    shapes = {}
+    for p in dss_paths:
+        if not os.path.exists(p):
+            continue
+        base_dir = os.path.dirname(os.path.abspath(p))
+        with open(p, "r", encoding="utf-8") as f:
+            for ln in f:
+                m = re.match(r'(?i)^\s*new\s+loadshape\.(\S+)', ln)
+                if not m:
+                    continue
+                try:
+                    vals = _read_mult(ln, base_dir, npts)
+                except (OSError, ValueError):
+                    vals = None
+                if vals is not None:
+                    shapes[m.group(1).lower()] = vals
+    return shapes
+
+
+def estimate_net_load(out_dir, npts=96):
+    """
+    Estimates the feeder net load (kW) of every step from the scenario files.
+
+    Parameters:
+    - out_dir (str): Scenario folder (ModifiedCircuitData) holding the DSS files.
+    - npts (int): Number of steps.
+
+    Returns:
+    - np.ndarray or None: Net load per step, or None when a load refers to a daily shape
+      that could not be read (the estimate would be incomplete).
+    """
+    shapes = read_loadshapes([os.path.join(out_dir, fn) for fn in SHAPE_FILES], npts)
+    net = np.zeros(npts)
+    for fn in LOAD_FILES + PV_FILES:
+        p = os.path.join(out_dir, fn)
+        if not os.path.exists(p):
+            continue
+        is_pv = fn in PV_FILES
+        with open(p, "r", encoding="utf-8") as f:
+            for ln in f:
+                if not re.match(r'(?i)^\s*new\s+(pvsystem|load)\.', ln):
+                    continue
+                kw = float(_prop(ln, "pmpp" if is_pv else "kW") or 0.0)
+                if is_pv:
+                    kw *= float(_prop(ln, "irradiance") or 1.0)
+                daily = _prop(ln, "daily")
+                if daily is None:
+                    mult = np.ones(npts)
+                elif daily.lower() in shapes:
+                    mult = shapes[daily.lower()]
+                else:
+                    return None
+                net += (-kw if is_pv else kw) * mult
+    return net
+
+
+def select_peak_steps(net, top_k=4, neighbours=1):
+    """
+    Picks the steps to solve: the top-k steps of the estimate and their neighbours.
+
+    Parameters:
+    - net (np.ndarray): Net load estimate per step.
+    - top_k (int): Number of highest steps to keep.
+    - neighbours (int): Steps added on each side of every selected step.
+
+    Returns:
+    - list: Sorted 0-based step indices.
+    """
+    n = len(net)
+    top = np.argsort(-np.asarray(net), kind="stable")[:max(1, top_k)]
+    steps = set()
+    for k in top:
+        steps.update(range(max(0, k - neighbours), min(n, k + neighbours + 1)))
+    return sorted(steps)
+
+
+def head_p_3ph(res, monitor):
+    """
+    Three-phase P (kW) of one monitor from `collect_daily_results` output.
+
+    Parameters:
+    - res (dict): Collected results.
+    - monitor (str): Monitor name, e.g. 'm2'.
+
+    Returns:
+    - np.ndarray: P_3ph per step (NaN on steps that were not solved).
+    """
+    p = res[f"{monitor}_P"]
+    out = np.nansum(p, axis=1)
+    out[np.isnan(p).all(axis=1)] = np.nan
+    return out
+
+
+def peak_error_estimate(net, p_head, steps):
+    """
+    Estimate of how much the true daily peak exceeds the peak of the solved steps.
+
+    The solved steps give the ratio between head P and the estimate (losses, voltage
+    dependence of the loads). The skipped steps are assumed to stay within the largest
+    ratio seen (at least 1.0), so each is taken at ratio × estimate. This is a heuristic,
+    not a bound: nothing guarantees the ratio holds off the window, which is chosen where
+    the estimate is high. The actual error comes from a full-day solve (DSS_PEAK_VERIFY).
+
+    Parameters:
+    - net (np.ndarray): Net load estimate per step.
+    - p_head (np.ndarray): Solved head P_3ph per step (from `head_p_3ph`).
+    - steps (list): Solved step indices.
+
+    Returns:
+    - float: Estimated error in kW (0.0: the solved window is expected to hold the peak).
+    """
+    net = np.asarray(net, dtype=float)
+    solved = np.zeros(net.size, dtype=bool)
+    solved[steps] = True
+    if solved.all():
+        return 0.0
+    p_solved = p_head[solved]
+    peak_solved = float(np.nanmax(p_solved))
+    pos = net[solved] > 0
+    ratio = float(np.nanmax(p_solved[pos] / net[solved][pos])) if pos.any() else 1.0
+    ratio = max(ratio, 1.0)
+    return max(0.0, ratio * float(net[~solved].max()) - peak_solved)
@@ -5,9 +5,20 @@ run_prepared_circuits.py  —  simple, procedural batch runner
 - Skips the repo root (".") even if it has the deploy script
 - Runs sequentially and streams output into this console
 - Also tees the same output to a UTF-8 log file if LOG_FILE is set
+- BATCH_WORKERS > 0 → N long-lived worker processes, each fed one folder at a time;
+  each keeps its imports and its OpenDSS engine across folders (no interpreter per run).
+  Folders of the same feeder go to the same worker, so with DSS_DELTA_MODE=1 the base
+  feeder is compiled once per worker and feeder instead of once per mix
+- Folders are dispatched longest-job-first: each folder's cost is its measured time from
+  a previous run (run_timing.json, else the run log), else an estimate from element counts (Loads.dss/Lines.dss and the
+  EV/PV/storage targets of scenario_assignments.json) scaled to seconds by the folders
+  that do have a measured time
+- After the batch, every run's ModifiedCircuitData/run_timing.json (per-phase timings
+  written by the runner) is collected into one table, TIMING_TABLE
 """
 
-import os, sys, subprocess, time, fnmatch
+import os, re, sys, csv, json, subprocess, time, fnmatch, io, queue, runpy, traceback
+import multiprocessing as mp
 
 # ---- user knobs ----
 ROOT_DIR    = "."   # where to search
@@ -15,11 +26,23 @@ RUNNER      = "power_flow_sim_daily_EV_STO_DG_deploy.py"
 GLOB_NAME   = "*_circuit_*"  # only run folders whose name matches this
 MAX_RUN     = None  # e.g., 3 for a quick test; None = all
 STOP_ON_ERR = False  # True → stop at first nonzero exit code
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "0"))  # 0 → one subprocess per folder; N → N persistent workers
+# OpenDSS backend handed to every run: "com" (Windows COM) or "dss_capi" (headless DSS C-API, Linux nodes)
+DSS_BACKEND = os.environ.get("DSS_BACKEND", "com" if os.name == "nt" else "dss_capi")
 
 # --- simple logging to a text file (UTF-8) ---
 LOG_FILE = "run_log.txt"   # set to None to disable file logging
 APPEND   = True            # False = overwrite, True = append
 
+# per-phase timing of every run (collected from <folder>/ModifiedCircuitData/run_timing.json)
+TIMING_JSON  = os.path.join("ModifiedCircuitData", "run_timing.json")
+TIMING_TABLE = "run_timing.csv"   # set to None to skip the table
+
+# ---- dispatch order ----
+SCHEDULE = os.environ.get("BATCH_SCHEDULE", "ljf")  # "ljf" → longest job first; "alpha" → alphabetical
+# relative cost weights of the count estimate (per element; storage drives controller iterations)
+COST_W_LOAD, COST_W_LINE, COST_W_EV, COST_W_PV, COST_W_STORAGE = 1.0, 0.5, 2.0, 1.0, 20.0
+
 # ---- tiny helpers (keep it minimal) ----
 def safe_print(s, end=""):
     try:
@@ -31,88 +54,235 @@ def safe_print(s, end=""):
             sys.stdout.write(end)
         sys.stdout.flush()
 
-# ---- discover circuit folders ----
-root_abs = os.path.abspath(ROOT_DIR)
-candidates = []
-
-for dirpath, dirnames, filenames in os.walk(root_abs):
-    # skip the root itself
-    if os.path.abspath(dirpath) == root_abs:
-        continue
-    base = os.path.basename(dirpath)
-    if "_circuit_" not in base:
-        continue
-    if RUNNER not in filenames:
-        continue
-    if not fnmatch.fnmatch(base, GLOB_NAME):
-        continue
-    candidates.append(dirpath)
-
-candidates.sort()
-if MAX_RUN:
-    candidates = candidates[:MAX_RUN]
-
-if not candidates:
-    print(f"No circuit folders found under {ROOT_DIR} with runner '{RUNNER}'.")
-    sys.exit(1)
-
-# open log (if enabled)
-logf = None
-if LOG_FILE:
+def measured_times(log_path):
+    """{folder basename: seconds} from the runner's 'Time taken' lines in a previous log (last wins)."""
+    out = {}
+    if not log_path or not os.path.exists(log_path):
+        return out
+    pat = re.compile(r"^\[([^\]]+)\] Time taken: ([0-9.]+) s")
+    with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
+        for ln in f:
+            m = pat.match(ln)
+            if m:
+                out[m.group(1)] = float(m.group(2))
+    return out
+
+_feeder_counts = {}
+def count_estimate(cdir):
+    """Unitless cost of one folder from its feeder size and scenario device counts."""
+    subs = sorted(d for d in os.listdir(cdir) if d.startswith("uhs") and os.path.isdir(os.path.join(cdir, d)))
+    key = subs[0] if subs else cdir
+    if key not in _feeder_counts:
+        n = {}
+        for fn, tag in (("Loads.dss", b"new load."), ("Lines.dss", b"new line.")):
+            try:
+                with open(os.path.join(cdir, key, fn), "rb") as f:
+                    n[fn] = f.read().lower().count(tag)
+            except OSError:
+                n[fn] = 0
+        _feeder_counts[key] = n
+    n = _feeder_counts[key]
     try:
-        mode = "a" if APPEND else "w"
-        logf = open(LOG_FILE, mode, encoding="utf-8", buffering=1)  # line-buffered
-        print(f"[log] Writing live output to {LOG_FILE}")
-    except Exception as e:
-        print(f"[log] Could not open {LOG_FILE}: {e}")
-        logf = None
-
-header = f"Found {len(candidates)} circuit folders with {RUNNER}:"
-print(header)
-if logf: logf.write(header + "\n")
-
-for p in candidates:
-    # try to show a relative path; fall back to absolute if needed
+        with open(os.path.join(cdir, "scenario_assignments.json"), "r", encoding="utf-8") as f:
+            a = json.load(f)
+    except Exception:
+        a = {}
+    n_ev = len(a.get("ev_loads_uncontrolled", [])) + len(a.get("ev_loads_controlled", [])) or len(a.get("ev_loads", []))
+    return (COST_W_LOAD * n["Loads.dss"] + COST_W_LINE * n["Lines.dss"] + COST_W_EV * n_ev
+            + COST_W_PV * len(a.get("pv_targets", [])) + COST_W_STORAGE * len(a.get("storage_targets", [])))
+
+def read_timing(cdir):
+    """The run_timing.json record a previous run left in this folder, or None."""
     try:
-        rel = os.path.relpath(p, root_abs)
+        with open(os.path.join(cdir, TIMING_JSON), "r", encoding="utf-8") as f:
+            return json.load(f)
     except Exception:
-        rel = p
-    line = "  " + rel
-    print(line)
-    if logf: logf.write(line + "\n")
+        return None
+
+def write_timing_table(cdirs, path):
+    """One row per folder with a timing record: meta fields, total, phase and nested columns."""
+    rows = []
+    for c in cdirs:
+        rec = read_timing(c)
+        if not rec:
+            continue
+        row = {k: v for k, v in rec.items() if k not in ("phases", "nested")}
+        row.update({f"t_{k}": v for k, v in rec.get("phases", {}).items()})
+        for k, v in rec.get("nested", {}).items():
+            row[f"t_{k}"], row[f"n_{k}"] = v["s"], v["n"]
+        rows.append(row)
+    if not rows:
+        return 0
+    cols = []
+    for r in rows:
+        cols += [k for k in r if k not in cols]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=cols)
+        w.writeheader()
+        w.writerows(rows)
+    return len(rows)
+
+def order_longest_first(cdirs, log_path):
+    """Sort folders by expected run time, largest first. Returns (ordered, n_measured)."""
+    times = measured_times(log_path)
+    for c in cdirs:
+        rec = read_timing(c)
+        if rec and "total_s" in rec:
+            times[os.path.basename(c)] = float(rec["total_s"])
+    est = {c: count_estimate(c) for c in cdirs}
+    known = [(times[os.path.basename(c)], est[c]) for c in cdirs if os.path.basename(c) in times and est[c] > 0]
+    # seconds per estimate unit, from folders with both a measured time and an estimate
+    scale = sorted(t / e for t, e in known)[len(known) // 2] if known else 1.0
+    cost = {c: times.get(os.path.basename(c), est[c] * scale) for c in cdirs}
+    return sorted(cdirs, key=lambda c: (-cost[c], c)), sum(os.path.basename(c) in times for c in cdirs)
+
+# ---- persistent worker pool (BATCH_WORKERS > 0) ----
+class _QueueWriter(io.TextIOBase):
+    """stdout/stderr stand-in inside a worker: forwards whole lines to the parent."""
+    def __init__(self, msg_q, cdir):
+        self.msg_q = msg_q
+        self.cdir = cdir
+        self.buf = ""
 
-# ---- run sequentially ----
-ok = 0; fail = 0; failures = []
-t0 = time.time()
+    def writable(self):
+        return True
 
-for cdir in candidates:
-    sep = "\n" + "="*80 + "\n"
+    def write(self, s):
+        self.buf += s
+        while "\n" in self.buf:
+            line, self.buf = self.buf.split("\n", 1)
+            self.msg_q.put(("line", self.cdir, line + "\n"))
+        return len(s)
+
+    def drain(self):
+        if self.buf:
+            self.msg_q.put(("line", self.cdir, self.buf + "\n"))
+            self.buf = ""
+
+def pool_worker(runner, dss_backend, job_q, msg_q):
+    """
+    Worker loop: run the folder's runner in-process via runpy, once per queued folder.
+    Imported modules (numpy/pandas/deployer_modules) and the OpenDSS engine cached in
+    pfs_engine stay alive between folders. A None job ends the worker.
+    """
+    os.environ.setdefault("DSS_NO_FORMS", "1")   # hint for headless DSS
+    os.environ["DSS_BACKEND"] = dss_backend      # read by pfs_engine when the engine is created
+    os.environ.setdefault("MPLBACKEND", "Agg")   # plotting helpers never open windows
     try:
-        rel = os.path.relpath(cdir, root_abs)
+        import numpy, pandas  # noqa: F401  (warm the heavy imports once)
     except Exception:
-        rel = cdir
-    run_hdr = f"RUN: {rel}\n" + "="*80
+        pass
 
-    # console + log headers
-    safe_print(sep)
-    safe_print(run_hdr + "\n")
-    if logf:
-        logf.write(sep)
-        logf.write(run_hdr + "\n")
-
-    env = dict(os.environ)
-    env["PYTHONUNBUFFERED"] = "1"                 # live output from child
-    env.setdefault("PYTHONIOENCODING", "utf-8")   # child prints utf-8 safely
-    env.setdefault("DSS_NO_FORMS", "1")           # hint for headless DSS
-
-    cmd = [sys.executable, "-u", RUNNER]
-    proc = subprocess.Popen(
-        cmd, cwd=cdir, env=env,
-        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-        universal_newlines=True, bufsize=1
-    )
-
-    for line in proc.stdout:
+    base_cwd  = os.getcwd()
+    base_path = list(sys.path)
+    base_argv = list(sys.argv)
+    real_out, real_err = sys.stdout, sys.stderr
+
+    while True:
+        cdir = job_q.get()
+        if cdir is None:
+            break
+        msg_q.put(("start", os.getpid(), cdir))
+        writer = _QueueWriter(msg_q, cdir)
+        sys.stdout = sys.stderr = writer
+        rc = 0
+        try:
+            os.chdir(cdir)
+            sys.argv = [runner]
+            runpy.run_path(os.path.join(cdir, runner), run_name="__main__")
+        except SystemExit as e:
+            if e.code is None:
+                rc = 0
+            elif isinstance(e.code, int):
+                rc = e.code
+            else:
+                print(e.code)
+                rc = 1
+        except Exception:
+            traceback.print_exc()
+            rc = 1
+        finally:
+            writer.drain()
+            sys.stdout, sys.stderr = real_out, real_err
+            os.chdir(base_cwd)
+            sys.path[:] = base_path
+            sys.argv = base_argv
+        msg_q.put(("done", os.getpid(), cdir, rc))
+
+if __name__ == "__main__":
+    # ---- discover circuit folders ----
+    root_abs = os.path.abspath(ROOT_DIR)
+    candidates = []
+
+    for dirpath, dirnames, filenames in os.walk(root_abs):
+        # skip the root itself
+        if os.path.abspath(dirpath) == root_abs:
+            continue
+        base = os.path.basename(dirpath)
+        if "_circuit_" not in base:
+            continue
+        if RUNNER not in filenames:
+            continue
+        if not fnmatch.fnmatch(base, GLOB_NAME):
+            continue
+        candidates.append(dirpath)
+
+    candidates.sort()
+    if MAX_RUN:
+        candidates = candidates[:MAX_RUN]
+    n_measured = None
+    if SCHEDULE == "ljf":
+        candidates, n_measured = order_longest_first(candidates, LOG_FILE)
+
+    if not candidates:
+        print(f"No circuit folders found under {ROOT_DIR} with runner '{RUNNER}'.")
+        sys.exit(1)
+
+    # open log (if enabled)
+    logf = None
+    if LOG_FILE:
+        try:
+            mode = "a" if APPEND else "w"
+            logf = open(LOG_FILE, mode, encoding="utf-8", buffering=1)  # line-buffered
+            print(f"[log] Writing live output to {LOG_FILE}")
+        except Exception as e:
+            print(f"[log] Could not open {LOG_FILE}: {e}")
+            logf = None
+
+    header = f"Found {len(candidates)} circuit folders with {RUNNER}:"
+    if n_measured is not None:
+        header += f" (longest first; {n_measured} timed by {LOG_FILE}, rest estimated)"
+    print(header)
+    if logf: logf.write(header + "\n")
+
+    for p in candidates:
+        # try to show a relative path; fall back to absolute if needed
+        try:
+            rel = os.path.relpath(p, root_abs)
+        except Exception:
+            rel = p
+        line = "  " + rel
+        print(line)
+        if logf: logf.write(line + "\n")
+
+    # ---- run sequentially (or through the worker pool) ----
+    ok = 0; fail = 0; failures = []
+    t0 = time.time()
+
+    def log_run_header(cdir):
+        sep = "\n" + "="*80 + "\n"
+        try:
+            rel = os.path.relpath(cdir, root_abs)
+        except Exception:
+            rel = cdir
+        run_hdr = f"RUN: {rel}\n" + "="*80
+        safe_print(sep)
+        safe_print(run_hdr + "\n")
+        if logf:
+            logf.write(sep)
+            logf.write(run_hdr + "\n")
+
+    def log_line(cdir, line):
         msg = f"[{os.path.basename(cdir)}] {line}"
         safe_print(msg)                 # to console (strip non-ASCII if needed)
         if logf:
@@ -121,43 +291,178 @@ for cdir in candidates:
             except Exception:
                 pass
 
-    rc = proc.wait()
-    exit_line = f"\nEXIT CODE: {rc}"
-    print(exit_line)
-    if logf: logf.write(exit_line + "\n")
-
-    if rc == 0:
-        ok += 1
-    else:
-        fail += 1
-        failures.append((cdir, rc))
-        if STOP_ON_ERR:
-            break
+    def log_exit(cdir, rc, tagged=False):
+        exit_line = f"\nEXIT CODE: {rc}"
+        if tagged:
+            exit_line = f"\n[{os.path.basename(cdir)}] EXIT CODE: {rc}"
+        print(exit_line)
+        if logf: logf.write(exit_line + "\n")
+
+    for cdir in (candidates if BATCH_WORKERS <= 0 else []):
+        # console + log headers
+        log_run_header(cdir)
+
+        env = dict(os.environ)
+        env["PYTHONUNBUFFERED"] = "1"                 # live output from child
+        env.setdefault("PYTHONIOENCODING", "utf-8")   # child prints utf-8 safely
+        env.setdefault("DSS_NO_FORMS", "1")           # hint for headless DSS
+        env["DSS_BACKEND"] = DSS_BACKEND              # engine backend for pfs_engine
+
+        cmd = [sys.executable, "-u", RUNNER]
+        proc = subprocess.Popen(
+            cmd, cwd=cdir, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            universal_newlines=True, bufsize=1
+        )
+
+        for line in proc.stdout:
+            log_line(cdir, line)
+
+        rc = proc.wait()
+        log_exit(cdir, rc)
+
+        if rc == 0:
+            ok += 1
+        else:
+            fail += 1
+            failures.append((cdir, rc))
+            if STOP_ON_ERR:
+                break
+
+        # small pause helps OpenDSS COM release resources on Windows
+        time.sleep(0.5)
+
+    if BATCH_WORKERS > 0:
+        n_workers = min(BATCH_WORKERS, len(candidates))
+        pool_hdr = f"[pool] Starting {n_workers} persistent workers (DSS backend: {DSS_BACKEND})"
+        print(pool_hdr)
+        if logf: logf.write(pool_hdr + "\n")
+
+        # spawn on every OS: a forked child must never inherit a live COM/DSS engine
+        ctx = mp.get_context("spawn")
+        msg_q = ctx.Queue()
+        pending = list(candidates)
+        assigned = {}      # worker index -> folder handed to it and not reported back yet
+        last_feeder = {}   # worker index -> feeder of the last folder it ran
+        outstanding = 0    # folders handed out and not reported back yet
+        stopping = False
+
+        def feeder_of(cdir):
+            # "<substation>_circuit_<n>_<mix>" -> "<substation>_circuit_<n>"
+            return re.sub(r"_\d+$", "", os.path.basename(cdir))
+
+        def spawn_worker():
+            job_q = ctx.Queue()
+            w = ctx.Process(target=pool_worker, args=(RUNNER, DSS_BACKEND, job_q, msg_q))
+            w.start()
+            return w, job_q
+
+        def feed_one(i):
+            # same feeder as this worker's last folder, else a feeder no other worker is on
+            if not pending or stopping:
+                return 0
+            busy = {last_feeder.get(j) for j in assigned if j != i}
+            pick = next((k for k, c in enumerate(pending) if feeder_of(c) == last_feeder.get(i)), None)
+            if pick is None:
+                pick = next((k for k, c in enumerate(pending) if feeder_of(c) not in busy), 0)
+            cdir = pending.pop(pick)
+            assigned[i] = cdir
+            last_feeder[i] = feeder_of(cdir)
+            workers[i][1].put(cdir)
+            return 1
+
+        def record(cdir, rc):
+            global ok, fail
+            if rc == 0:
+                ok += 1
+            else:
+                fail += 1
+                failures.append((cdir, rc))
 
-    # small pause helps OpenDSS COM release resources on Windows
-    time.sleep(0.5)
+        workers = [spawn_worker() for _ in range(n_workers)]
+        pid_to_idx = {w.pid: i for i, (w, _) in enumerate(workers)}
+        for i in range(n_workers):
+            outstanding += feed_one(i)
 
-dt = time.time() - t0
-summary = "\n" + "-"*60 + f"\nDone in {dt:.1f}s  |  ok={ok}  fail={fail}"
-print(summary)
-if logf: logf.write(summary + "\n")
+        next_check = time.time() + 1.0
+        while outstanding > 0:
+            try:
+                msg = msg_q.get(timeout=1.0)
+            except queue.Empty:
+                msg = None
+
+            if msg is not None and msg[0] == "start":
+                _, pid, cdir = msg
+                log_run_header(cdir)
+            elif msg is not None and msg[0] == "line":
+                _, cdir, line = msg
+                log_line(cdir, line)
+            elif msg is not None and msg[0] == "done":
+                _, pid, cdir, rc = msg
+                i = pid_to_idx.get(pid)
+                if i is None:   # late message of a worker already replaced below
+                    continue
+                assigned.pop(i, None)
+                log_exit(cdir, rc, tagged=True)
+                record(cdir, rc)
+                outstanding -= 1
+                if rc != 0 and STOP_ON_ERR:
+                    stopping = True
+                outstanding += feed_one(i)
+
+            # at least once a second, even while other workers keep the queue busy: a worker
+            # that died mid-run (e.g. engine crash) fails its folder and is replaced
+            if time.time() < next_check:
+                continue
+            next_check = time.time() + 1.0
+            for i, (w, _) in enumerate(workers):
+                if w.is_alive():
+                    continue
+                pid_to_idx.pop(w.pid, None)
+                workers[i] = spawn_worker()
+                pid_to_idx[workers[i][0].pid] = i
+                cdir = assigned.pop(i, None)
+                if cdir is not None:
+                    log_exit(cdir, w.exitcode, tagged=True)
+                    record(cdir, w.exitcode)
+                    outstanding -= 1
+                    if STOP_ON_ERR:
+                        stopping = True
+                    outstanding += feed_one(i)
+
+        for _, job_q in workers:
+            job_q.put(None)
+        for w, _ in workers:
+            w.join()
+
+    dt = time.time() - t0
+    summary = "\n" + "-"*60 + f"\nDone in {dt:.1f}s  |  ok={ok}  fail={fail}"
+    print(summary)
+    if logf: logf.write(summary + "\n")
+
+    if TIMING_TABLE:
+        n_timed = write_timing_table(candidates, TIMING_TABLE)
+        if n_timed:
+            tline = f"[timing] {n_timed} per-phase records → {TIMING_TABLE}"
+            print(tline)
+            if logf: logf.write(tline + "\n")
+
+    if failures:
+        print("\nFailures:")
+        if logf: logf.write("\nFailures:\n")
+        for p, rc in failures:
+            try:
+                rel = os.path.relpath(p, root_abs)
+            except Exception:
+                rel = p
+            fl = f"  {rel}  (exit {rc})"
+            print(fl)
+            if logf: logf.write(fl + "\n")
 
-if failures:
-    print("\nFailures:")
-    if logf: logf.write("\nFailures:\n")
-    for p, rc in failures:
+    if logf:
         try:
-            rel = os.path.relpath(p, root_abs)
+            logf.close()
         except Exception:
-            rel = p
-        fl = f"  {rel}  (exit {rc})"
-        print(fl)
-        if logf: logf.write(fl + "\n")
-
-if logf:
-    try:
-        logf.close()
-    except Exception:
-        pass
+            pass
 
-sys.exit(0 if fail == 0 else 2)
+    sys.exit(0 if fail == 0 else 2)
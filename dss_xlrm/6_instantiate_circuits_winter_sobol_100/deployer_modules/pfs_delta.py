@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Module Name: pfs_delta.py
+Description:
+    Delta mode for the deploy runner. Every feeder × mix folder shares the same Lines,
+    Transformers, LineCodes, Capacitors and Buscoords; only the scenario files differ
+    (LoadShapes.dss, Loads.dss and the EV/PV/Storage files written by the runner).
+    Instead of compiling the whole Master for every mix, the engine compiles a base
+    Master (the feeder without the scenario files) once, and each mix is applied on top
+    of it as a small redirect script (Master_delta.dss):
+        - elements added by the previous mix and not redefined now are disabled
+        - the scenario files are redirected (New on an existing name redefines it)
+        - re-added elements that were disabled before are enabled again
+        - monitors/meters are reset and the Solve/Export tail of Master runs as usual
+    The compiled base is keyed by the content of the base Master and the files it
+    redirects, so a worker that moves to another feeder recompiles automatically.
+
+Functions:
+    - split_master: Splits Master.dss into base lines, scenario redirects and solve tail.
+    - base_key_for: Content hash identifying a compiled base feeder.
+    - new_elements_in: Lists the circuit elements defined with New in a DSS file.
+    - apply_scenario_delta: Compiles the base if needed and applies one scenario on top.
+
+Usage:
+    This module is intended to be imported and used by
+    `power_flow_sim_daily_EV_STO_DG_deploy.py`. It is not designed to be executed directly.
+
+Author: Luis F. Victor Gallardo
+Date: 2026/10/18
+Version: 0.1
+"""
+
+import os
+import re
+import hashlib
+
+# Files that change from one mix to the next (everything else in Master is the base feeder)
+SCENARIO_FILES = ("loadshapes.dss", "loadshapes_ev.dss", "loadshapes_pv.dss",
+                  "loads.dss", "storage.dss", "pvsystems.dss")
+
+# Circuit element classes a scenario may add (and that must be disabled when it goes away)
+DELTA_CLASSES = ("load", "storage", "storagecontroller", "pvsystem", "monitor",
+                 "energymeter", "generator")
+
+BASE_MASTER_NAME  = "Master_base.dss"
+DELTA_MASTER_NAME = "Master_delta.dss"
+
+
+def _redirect_target(line):
+    m = re.match(r'(?i)^\s*(?:redirect|compile|buscoords)\s+"?([^"\s]+)"?', line)
+    return m.group(1) if m else None
+
+
+def split_master(master_path):
+    """
+    Splits a deploy Master.dss at its first Solve.
+
+    Parameters:
+    - master_path (str): Path to the scenario Master.dss.
+
+    Returns:
+    - tuple: (base_lines, scenario_files, tail_lines). base_lines is the part before the
+      first Solve without the scenario redirects, scenario_files the redirected scenario
+      file names in Master order, and tail_lines the Solve line and everything after it.
+    """
+    with open(master_path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+
+    base_lines, scenario_files, tail_lines = [], [], []
+    in_tail = False
+    for ln in lines:
+        if not in_tail and re.match(r'(?i)^\s*solve\b', ln):
+            in_tail = True
+        if in_tail:
+            tail_lines.append(ln)
+            continue
+        target = _redirect_target(ln)
+        if target and re.match(r'(?i)^\s*redirect\b', ln) and os.path.basename(target).lower() in SCENARIO_FILES:
+            scenario_files.append(target)
+            continue
+        base_lines.append(ln)
+    return base_lines, scenario_files, tail_lines
+
+
+def base_key_for(master_dir, base_lines):
+    """
+    Hashes the base Master text together with every file it redirects.
+
+    Parameters:
+    - master_dir (str): Folder the relative paths in Master resolve against.
+    - base_lines (list): Base Master lines from `split_master`.
+
+    Returns:
+    - str: Hex digest identifying the base feeder.
+    """
+    h = hashlib.sha1()
+    for ln in base_lines:
+        h.update(ln.encode("utf-8"))
+        target = _redirect_target(ln)
+        if target:
+            path = target if os.path.isabs(target) else os.path.join(master_dir, target)
+            try:
+                with open(path, "rb") as f:
+                    h.update(f.read())
+            except OSError:
+                h.update(b"<missing>")
+    return h.hexdigest()
+
+
+def new_elements_in(dss_path):
+    """
+    Lists the circuit elements a DSS file defines with New (classes in DELTA_CLASSES).
+
+    Parameters:
+    - dss_path (str): DSS file to scan.
+
+    Returns:
+    - dict: {lower-case 'class.name': 'Class.name' as written in the file}.
+    """
+    found = {}
+    if not os.path.exists(dss_path):
+        return found
+    with open(dss_path, "r", encoding="utf-8") as f:
+        for ln in f:
+            m = re.match(r'(?i)^\s*new\s+(\w+)\.(\S+)', ln)
+            if m and m.group(1).lower() in DELTA_CLASSES:
+                full = f"{m.group(1)}.{m.group(2)}"
+                found[full.lower()] = full
+    return found
+
+
+def apply_scenario_delta(engine, master_path, run_tail=True):
+    """
+    Runs one scenario Master through the engine's cached base feeder.
+
+    The base feeder is compiled (and Master_base.dss written next to Master.dss) only when
+    the engine holds no base yet or holds another feeder. The scenario itself is applied
+    through Master_delta.dss, which ends with the Solve/Export tail of Master.dss, so the
+    results land in the same files a full compile would write.
+
+    Parameters:
+    - engine (DSSEngine): Engine from `pfs_engine.get_dss_engine`.
+    - master_path (str): Path to the scenario Master.dss.
+    - run_tail (bool): False stops before the Solve (the caller steps the solve itself).
+
+    Returns:
+    - bool: True if the base feeder had to be compiled for this scenario.
+    """
+    master_dir = os.path.dirname(os.path.abspath(master_path))
+    base_lines, scenario_files, tail_lines = split_master(master_path)
+    key = base_key_for(master_dir, base_lines)
+
+    compiled_base = False
+    if engine.base_key != key:
+        base_path = os.path.join(master_dir, BASE_MASTER_NAME)
+        with open(base_path, "w", encoding="utf-8") as f:
+            f.writelines(base_lines)
+        engine.compile(base_path)
+        engine.base_key = key
+        compiled_base = True
+
+    current = {}
+    for fn in scenario_files:
+        path = fn if os.path.isabs(fn) else os.path.join(master_dir, fn)
+        current.update(new_elements_in(path))
+
+    to_disable = sorted(set(engine.delta_elements) - set(current))
+    to_enable  = sorted(engine.disabled_elements & set(current))
+
+    out = ["! Scenario delta on top of the compiled base feeder (written by pfs_delta)\n",
+           f'Set DataPath="{master_dir}"\n']
+    if to_disable:
+        out.append("\n! Elements of the previous scenario\n")
+        out.extend(f"Disable {engine.delta_elements[k]}\n" for k in to_disable)
+    out.append("\n! Scenario files\n")
+    out.extend(f"Redirect {fn}\n" for fn in scenario_files)
+    if to_enable:
+        out.append("\n! Re-added elements\n")
+        out.extend(f"Enable {current[k]}\n" for k in to_enable)
+    out.append("\nReset\nSet hour=0 sec=0\n\n")
+    if run_tail:
+        out.extend(tail_lines)
+
+    delta_path = os.path.join(master_dir, DELTA_MASTER_NAME)
+    with open(delta_path, "w", encoding="utf-8") as f:
+        f.writelines(out)
+    try:
+        engine.text(f'Redirect "{delta_path}"')
+    except Exception:
+        engine.base_key = None  # unknown engine state → next scenario recompiles the base
+        raise
+
+    engine.disabled_elements = (engine.disabled_elements | set(to_disable)) - set(to_enable)
+    engine.delta_elements = current
+    return compiled_base
@@ -19,7 +19,6 @@ Version: 0.1
 """
 
 # Import general packages
-import comtypes.client as cc
 import os 
 import datetime
 import pandas as pd
@@ -93,7 +92,7 @@ def modify_master_file(master_file_path, timestep, irradiance_zero):
 
 def modify_dss_files(file_path, timestep, profiles, BASE_MULTIPLIER,
                      HP_RESI_LIMIT, dfs_hp_profile, df_hp_compare, CASE_SIMUL,
-                     array_ev_profiles):
+                     array_ev_profiles, rng=None):
     """
     Modifies .dss files to update load and PV system parameters based on profile data
     and adds additional loads for heat pumps and EVs according to specified profiles.
@@ -110,6 +109,8 @@ def modify_dss_files(file_path, timestep, profiles, BASE_MULTIPLIER,
                        values are data frames containing profile data.
     - array_heatpump_profiles (numpy.ndarray): An array containing heat pump profiles.
     - array_ev_profiles (numpy.ndarray): An array containing electric vehicle profiles.
+    - rng (numpy.random.Generator, optional): Stream for the EV/heat pump host draws and
+      the profile shuffle (default: a RandomState seeded with 555, the former global seed).
 
     Returns:
     - tuple: A tuple containing three elements:
@@ -151,7 +152,8 @@ def modify_dss_files(file_path, timestep, profiles, BASE_MULTIPLIER,
     rand_counter = 0
     rand_count_clean = 0
 
-    np.random.seed(555)
+    if rng is None:
+        rng = np.random.RandomState(555)
 
     new_lines = []
     irr_zero = False
@@ -163,18 +165,18 @@ def modify_dss_files(file_path, timestep, profiles, BASE_MULTIPLIER,
 
     count_loads_resi = len(load_names_resi)
 
-    ev_apply_list = np.random.choice(range(count_loads_resi-1), ev_lim, replace=False)
+    ev_apply_list = rng.choice(count_loads_resi-1, ev_lim, replace=False)
     ev_apply_list.sort()
     
     # print(count_loads_resi, range(count_loads_resi-1), hp_lim)
     
-    hp_apply_list = np.random.choice(range(count_loads_resi-1), hp_lim, replace=False)
+    hp_apply_list = rng.choice(count_loads_resi-1, hp_lim, replace=False)
     hp_apply_list.sort()
 
     ''' Assignation of heat pump profiles '''
     # Generate unique profiles and shuffle them to ensure random assignment
     unique_profiles = df_hp_compare['Profile'].unique()
-    np.random.shuffle(unique_profiles)
+    rng.shuffle(unique_profiles)
 
     # Repeat profiles to match the length of hp_apply_list
     assigned_profiles_hp = np.tile(unique_profiles, (len(hp_apply_list) // len(unique_profiles) + 1))[:len(hp_apply_list)]
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+Module Name: pfs_results.py
+Description:
+    Bulk result extraction for the deploy runner. Instead of letting Master.dss run the
+    96-step daily Solve and exporting every Monitor to CSV (later re-read and converted
+    to P/Q by aggregate_m1_m2_with_circuits.py), the runner steps the daily solve itself
+    and reads the engine after every step:
+        - P/Q per phase at the terminal of every monitor defined in Master (m1/m2, the
+          feeder head), the same quantity a mode=1 monitor records
+        - P/Q and %stored of every storage element
+        - optionally the per-unit voltage magnitude of every node (AllBusVmagPu)
+        - convergence flag and iteration count per step
+    A subset of steps can be solved instead of the full day (peak-window mode, see
+    pfs_peak.py); the time is set before every step that does not follow the previous one.
+    Time-parallel solve: without storage the daily steps are independent snapshots, so
+    the steps can be split into contiguous chunks solved by forked copies of the compiled
+    engine (one process per chunk) and stitched back in step order. Forking needs a
+    platform with fork (Linux/macOS, DSS C-API backend); elsewhere the caller solves
+    sequentially.
+    Values go into preallocated (npts, n) NumPy arrays and are written as one compressed
+    results.npz per run.
+    Warm start: the converged node voltages of every step are kept in memory per feeder
+    (keyed by the node list). When the next mix of the same feeder runs in the same
+    process, each step starts from the voltages of the same step of that previous mix
+    instead of the previous step of the current run. This needs a backend that exposes
+    the solver voltage vector (DSS C-API); otherwise the engine's own continuation from
+    the previous step is used. Iteration counts per step are recorded either way.
+
+Functions:
+    - master_monitors: Lists the monitors (name, element, terminal) defined in Master.dss.
+    - write_prelude_master: Writes Master.dss up to (not including) its first Solve.
+    - terminal_pq: Per-phase P/Q flowing into one terminal of an element.
+    - collect_daily_results: Steps the daily solve and fills the result arrays.
+    - collect_daily_results_parallel: Same, with the steps split across forked processes.
+    - merge_step_results: Stitches per-chunk results back into one result dict.
+    - save_results_npz: Writes the result arrays to a compressed .npz file.
+
+Usage:
+    This module is intended to be imported and used by
+    `power_flow_sim_daily_EV_STO_DG_deploy.py`. It is not designed to be executed directly.
+
+Author: Luis F. Victor Gallardo
+Date: 2026/10/18
+Version: 0.4
+"""
+
+import os
+import re
+import hashlib
+import multiprocessing as mp
+import numpy as np
+
+PRELUDE_MASTER_NAME = "Master_prelude.dss"
+MAX_PHASES = 3
+TIME_CHUNK_MIN_STEPS = 8   # fewer steps per chunk than this is not worth a process
+
+# (engine, kwargs) shared with forked chunk solvers (set only while a pool is running)
+_FORK_JOB = None
+
+# {node list hash: (npts, n_nodes + 1) complex voltages of the last converged mix}
+_WARM_STATES = {}
+
+
+def master_monitors(master_path):
+    """
+    Lists the monitors defined directly in a Master.dss file.
+
+    Parameters:
+    - master_path (str): Path to Master.dss.
+
+    Returns:
+    - list: One dict per monitor with keys 'name', 'element' and 'terminal'.
+    """
+    out = []
+    with open(master_path, "r", encoding="utf-8") as f:
+        for ln in f:
+            m = re.match(r'(?i)^\s*new\s+monitor\.(\S+)\s+(.*)', ln)
+            if not m:
+                continue
+            m_el = re.search(r'(?i)\belement\s*=\s*([^\s]+)', m.group(2))
+            if not m_el:
+                continue
+            m_tr = re.search(r'(?i)\bterminal\s*=\s*(\d+)', m.group(2))
+            out.append({"name": m.group(1).lower(),
+                        "element": m_el.group(1),
+                        "terminal": int(m_tr.group(1)) if m_tr else 1})
+    return out
+
+
+def write_prelude_master(master_path):
+    """
+    Writes the part of Master.dss before its first Solve next to it (no solve, no exports).
+
+    Parameters:
+    - master_path (str): Path to Master.dss.
+
+    Returns:
+    - str: Path of the written Master_prelude.dss.
+    """
+    with open(master_path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    prelude = []
+    for ln in lines:
+        if re.match(r'(?i)^\s*solve\b', ln):
+            break
+        prelude.append(ln)
+    out_path = os.path.join(os.path.dirname(os.path.abspath(master_path)), PRELUDE_MASTER_NAME)
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.writelines(prelude)
+    return out_path
+
+
+def terminal_pq(engine, full_name, terminal=1):
+    """
+    Per-phase P/Q (kW/kvar) flowing into one terminal of an element.
+
+    Parameters:
+    - engine (DSSEngine): Engine from `pfs_engine.get_dss_engine`.
+    - full_name (str): Class-qualified element name, e.g. 'Line.l1'.
+    - terminal (int): 1-based terminal number.
+
+    Returns:
+    - tuple: (P, Q) lists with one entry per phase.
+    """
+    el = engine.element(full_name)
+    n_cond = el.NumConductors
+    n_ph = el.NumPhases
+    pw = el.Powers
+    off = (terminal - 1) * n_cond * 2
+    return list(pw[off:off + 2 * n_ph:2]), list(pw[off + 1:off + 2 * n_ph:2])
+
+
+def _node_key(engine):
+    return hashlib.sha1("\n".join(engine.circuit.AllNodeNames).encode("utf-8")).hexdigest()
+
+
+def collect_daily_results(engine, monitors, storage_names, npts=96, stepsize="15m", with_voltages=False,
+                          warm_start=False, steps=None):
+    """
+    Runs the daily simulation one step at a time and reads the results after each step.
+
+    The circuit must already be compiled without its Solve (see `write_prelude_master`).
+    Time advances exactly as in 'Solve mode=daily number=npts', so monitors and storage
+    controllers see the same sequence of steps.
+
+    Parameters:
+    - engine (DSSEngine): Engine holding the compiled circuit.
+    - monitors (list): Output of `master_monitors`; P/Q is read at each monitored terminal.
+    - storage_names (list): Storage element names without the 'Storage.' prefix.
+    - npts (int): Number of steps.
+    - stepsize (str): OpenDSS stepsize string.
+    - with_voltages (bool): Also store AllBusVmagPu per step.
+    - warm_start (bool): Seed each step from the same step of the previous mix of this
+      feeder (when the backend allows it) and keep this run's voltages for the next mix.
+    - steps (list): 0-based steps to solve (sorted); None solves all npts steps. Skipped
+      steps keep NaN P/Q and solved=False.
+
+    Returns:
+    - dict: name → NumPy array, ready for `save_results_npz`.
+    """
+    n_sto = len(storage_names)
+    res = {
+        "hour":       np.zeros(npts),
+        "converged":  np.zeros(npts, dtype=bool),
+        "iterations": np.zeros(npts, dtype=np.int32),
+        "solved":     np.zeros(npts, dtype=bool),
+        "storage_names": np.array(storage_names, dtype=str),
+        "storage_P":   np.zeros((npts, n_sto)),
+        "storage_Q":   np.zeros((npts, n_sto)),
+        "storage_soc": np.zeros((npts, n_sto)),
+        "monitor_names":    np.array([m["name"] for m in monitors], dtype=str),
+        "monitor_elements": np.array([m["element"] for m in monitors], dtype=str),
+    }
+    for m in monitors:
+        res[f"{m['name']}_P"] = np.full((npts, MAX_PHASES), np.nan)
+        res[f"{m['name']}_Q"] = np.full((npts, MAX_PHASES), np.nan)
+    vmag = None
+
+    engine.text(f"Set mode=daily stepsize={stepsize} number=1")
+    engine.text("Set hour=0 sec=0")
+    sol = engine.solution
+    step_h = None
+    steps = list(range(npts)) if steps is None else sorted(steps)
+    full_day = len(steps) == npts
+
+    seed = captured = node_key = None
+    if warm_start and engine.node_voltages_view() is not None:
+        node_key = _node_key(engine)
+        seed = _WARM_STATES.get(node_key)
+        captured = np.zeros((npts, engine.node_voltages_view().size), dtype=np.complex128)
+        if seed is not None and seed.shape != captured.shape:
+            seed = None
+    res["warm_started"] = np.array(seed is not None)
+
+    prev = -1
+    for k in steps:
+        if k != prev + 1:
+            if step_h is None:
+                step_h = float(sol.StepSize) / 3600.0
+            t_h = k * step_h
+            engine.text(f"Set hour={int(t_h)} sec={(t_h - int(t_h)) * 3600.0:.3f}")
+        prev = k
+        if seed is not None and engine.solution_initialized:
+            v = engine.node_voltages_view()
+            if v is not None and v.size == seed.shape[1]:
+                v[:] = seed[k]
+        sol.Solve()
+        if captured is not None:
+            v = engine.node_voltages_view()
+            if v is not None and v.size == captured.shape[1]:
+                captured[k, :] = v
+        res["solved"][k]     = True
+        res["converged"][k]  = bool(sol.Converged)
+        res["iterations"][k] = int(sol.Iterations)
+        try:
+            res["hour"][k] = float(sol.dblHour)
+        except Exception:
+            if step_h is None:
+                step_h = float(sol.StepSize) / 3600.0
+            res["hour"][k] = (k + 1) * step_h
+
+        for m in monitors:
+            p, q = terminal_pq(engine, m["element"], m["terminal"])
+            n = min(len(p), MAX_PHASES)
+            res[f"{m['name']}_P"][k, :n] = p[:n]
+            res[f"{m['name']}_Q"][k, :n] = q[:n]
+
+        for j, nm in enumerate(storage_names):
+            pw = engine.element_powers(f"Storage.{nm}")
+            res["storage_P"][k, j] = sum(pw[0::2])
+            res["storage_Q"][k, j] = sum(pw[1::2])
+            res["storage_soc"][k, j] = float(engine.text(f"? Storage.{nm}.%stored") or "nan")
+
+        if with_voltages:
+            v = engine.bus_vmag_pu()
+            if vmag is None:
+                vmag = np.zeros((npts, len(v)), dtype=np.float32)
+                res["node_names"] = np.array(list(engine.circuit.AllNodeNames), dtype=str)
+            vmag[k, :] = v
+
+    if vmag is not None:
+        res["vmag_pu"] = vmag
+    if not full_day:
+        if step_h is None:
+            step_h = float(sol.StepSize) / 3600.0
+        idle = ~res["solved"]
+        res["hour"][idle] = (np.flatnonzero(idle) + 1) * step_h
+        if vmag is not None:
+            vmag[idle, :] = np.nan
+    if captured is not None and full_day and res["converged"].all():
+        _WARM_STATES.clear()  # one feeder at a time (the pool keeps a worker on one feeder)
+        _WARM_STATES[node_key] = captured
+    return res
+
+
+def _solve_chunk(steps):
+    engine, kwargs = _FORK_JOB
+    return collect_daily_results(engine, steps=steps, **kwargs)
+
+
+def merge_step_results(parts, npts=96):
+    """
+    Stitches results of disjoint step subsets into one result dict.
+
+    Parameters:
+    - parts (list): Outputs of `collect_daily_results`, each with its own 'solved' mask.
+    - npts (int): Number of steps.
+
+    Returns:
+    - dict: Per-step arrays take the rows each part solved; everything else comes from
+      the first part that has it.
+    """
+    out = {}
+    for part in parts:
+        mask = part["solved"]
+        for key, arr in part.items():
+            per_step = (isinstance(arr, np.ndarray) and arr.ndim >= 1 and arr.shape[0] == npts
+                        and not key.endswith("_names"))
+            if key not in out:
+                out[key] = arr.copy() if isinstance(arr, np.ndarray) else arr
+            elif per_step:
+                out[key][mask] = arr[mask]
+    return out
+
+
+def collect_daily_results_parallel(engine, monitors, storage_names, n_workers, npts=96, stepsize="15m",
+                                   with_voltages=False, steps=None):
+    """
+    Solves the daily steps in contiguous chunks on forked copies of the compiled engine.
+
+    Only valid when the steps do not depend on each other (no storage/storage controller).
+    The engine must hold the compiled circuit at hour 0, as for `collect_daily_results`;
+    it is left untouched in this process.
+
+    Parameters:
+    - engine (DSSEngine): Engine holding the compiled circuit.
+    - monitors (list): Output of `master_monitors`.
+    - storage_names (list): Must be empty.
+    - n_workers (int): Maximum number of processes.
+    - npts (int): Number of steps.
+    - stepsize (str): OpenDSS stepsize string.
+    - with_voltages (bool): Also store AllBusVmagPu per step.
+    - steps (list): 0-based steps to solve; None solves all npts steps.
+
+    Returns:
+    - dict or None: Merged results, or None when a parallel solve is not possible here
+      (no fork, storage present, or too few steps); the caller then solves sequentially.
+    """
+    global _FORK_JOB
+    steps = list(range(npts)) if steps is None else sorted(steps)
+    n_workers = min(int(n_workers), len(steps) // TIME_CHUNK_MIN_STEPS)
+    if n_workers < 2 or storage_names or "fork" not in mp.get_all_start_methods():
+        return None
+    chunks = [list(map(int, c)) for c in np.array_split(steps, n_workers)]
+    _FORK_JOB = (engine, {"monitors": monitors, "storage_names": [], "npts": npts,
+                          "stepsize": stepsize, "with_voltages": with_voltages})
+    try:
+        with mp.get_context("fork").Pool(n_workers) as pool:
+            parts = pool.map(_solve_chunk, chunks)
+    finally:
+        _FORK_JOB = None
+    return merge_step_results(parts, npts)
+
+
+def save_results_npz(path, res):
+    """
+    Writes the result arrays of one run to a compressed .npz file.
+
+    Parameters:
+    - path (str): Output file path (e.g. ModifiedCircuitData/results.npz).
+    - res (dict): Output of `collect_daily_results`.
+
+    Returns:
+    - None
+    """
+    np.savez_compressed(path, **res)